@@ -0,0 +1,68 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+# Measures cold-start latency: each statement is run in a fresh
+# interpreter and the median wall time over several runs is reported.
+#
+#   python bench_import.py [-n RUNS]
+
+import os
+import subprocess
+import sys
+import time
+
+import argparse
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+benchmarks = [
+    ('interpreter', 'pass'),
+    ('import cli', 'import cli'),
+    ('cli --help', 'import cli, sys; sys.argv = ["cli", "--help"]\ntry: cli.main()\nexcept SystemExit: pass'),
+    ('import musicxmltomei', 'import musicxmltomei'),
+    ('import meitomusicxml', 'import meitomusicxml'),
+]
+
+def time_statement(statement, runs):
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        proc = subprocess.run([sys.executable, '-c', statement], cwd=here,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        times.append(time.time() - start)
+        if proc.returncode != 0:
+            return None, proc.stderr.decode('utf-8', 'replace').strip().splitlines()[-1]
+
+    times.sort()
+    return times[len(times) // 2], None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cold-start import time of the converters.')
+    parser.add_argument('-n', '--runs', help='runs per benchmark', type=int, default=10)
+    args = parser.parse_args()
+
+    for name, statement in benchmarks:
+        median, error = time_statement(statement, args.runs)
+        if error is None:
+            print('%-24s %8.1f ms' % (name, median * 1000))
+        else:
+            print('%-24s   failed: %s' % (name, error))
@@ -0,0 +1,57 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+# Measures what the measure memo gains on repetitive input, for both
+# directions: the generated parts repeat every seven measures, so nearly
+# every measure after the first few is served from the cache.
+#
+#   python bench_memo.py [-p PARTS] [-n MEASURES] [-s MEMO_SIZE] [-r RUNS]
+
+import argparse
+
+from musicxmltomei import MusicXMLtoMei
+from meitomusicxml import MeitoMusicXML
+from bench_movements import generate_score, time_call
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark conversion with and without the measure memo.')
+    parser.add_argument('-p', '--parts', help='number of parts', type=int, default=8)
+    parser.add_argument('-n', '--measures', help='number of measures', type=int, default=200)
+    parser.add_argument('-s', '--memo-size', help='memo entries', type=int, default=256)
+    parser.add_argument('-r', '--runs', help='runs per benchmark', type=int, default=3)
+    args = parser.parse_args()
+
+    score = generate_score(args.parts, args.measures)
+    mei = MusicXMLtoMei(input_str=score).convert()
+
+    benchmarks = [
+        ('musicxml -> mei', lambda **kwargs: MusicXMLtoMei(input_str=score, **kwargs)),
+        ('mei -> musicxml', lambda **kwargs: MeitoMusicXML(input_str=mei, **kwargs)),
+    ]
+    for name, converter in benchmarks:
+        plain = time_call(lambda: converter().build(), args.runs)
+        memoised = converter(memo_size=args.memo_size)
+        memoised.build()
+        hits = memoised.memo.hits / float(memoised.memo.hits + memoised.memo.misses)
+        memo = time_call(lambda: converter(memo_size=args.memo_size).build(), args.runs)
+        print('%-18s %8.1f ms without memo %8.1f ms with memo (%.2fx, %.0f%% hits)'
+              % (name, plain * 1000, memo * 1000, plain / memo, hits * 100))
@@ -0,0 +1,108 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+# Measures how much converting movements in a thread pool gains over
+# converting them one after the other, for both directions, on generated
+# multi-movement scores. Most of the conversion holds the GIL, so expect
+# far less than a speedup by the number of workers.
+#
+#   python bench_movements.py [-m MOVEMENTS] [-p PARTS] [-n MEASURES] [-r RUNS]
+
+import os
+import shutil
+import tempfile
+import time
+
+import argparse
+
+from musicxmltomei import MusicXMLtoMei
+from meitomusicxml import MeitoMusicXML
+
+def generate_score(num_parts, num_measures):
+    '''
+    Returns a partwise musicxml score with the given number of parts
+    and measures of four quarter notes each
+    '''
+
+    part_list = []
+    parts = []
+    for p in range(num_parts):
+        part_list.append('<score-part id="P%d"><part-name>Part %d</part-name>'
+                         '<score-instrument id="P%d-I1"><instrument-name>Piano</instrument-name></score-instrument>'
+                         '<midi-instrument id="P%d-I1"><midi-channel>1</midi-channel><midi-program>1</midi-program></midi-instrument>'
+                         '</score-part>' % (p, p, p, p))
+
+        measures = []
+        for m in range(num_measures):
+            attributes = ''
+            if m == 0:
+                attributes = ('<attributes><divisions>1</divisions><key><fifths>0</fifths><mode>major</mode></key>'
+                              '<time><beats>4</beats><beat-type>4</beat-type></time><clef><sign>G</sign><line>2</line></clef></attributes>')
+            notes = ''.join('<note><pitch><step>%s</step><octave>4</octave></pitch><duration>1</duration><type>quarter</type></note>'
+                            % 'CDEFGAB'[(m + n + p) % 7] for n in range(4))
+            measures.append('<measure number="%d">%s%s</measure>' % (m+1, attributes, notes))
+        parts.append('<part id="P%d">%s</part>' % (p, ''.join(measures)))
+
+    return ('<score-partwise><identification><encoding><software>bench_movements</software></encoding></identification>'
+            '<part-list>%s</part-list>%s</score-partwise>' % (''.join(part_list), ''.join(parts)))
+
+def time_call(func, runs):
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+
+    times.sort()
+    return times[len(times) // 2]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark sequential against threaded conversion of movements.')
+    parser.add_argument('-m', '--movements', help='number of movements', type=int, default=4)
+    parser.add_argument('-p', '--parts', help='parts per movement', type=int, default=8)
+    parser.add_argument('-n', '--measures', help='measures per movement', type=int, default=200)
+    parser.add_argument('-r', '--runs', help='runs per benchmark', type=int, default=3)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        score = generate_score(args.parts, args.measures)
+        paths = []
+        for n in range(args.movements):
+            path = os.path.join(tmp_dir, 'movement-%d.xml' % (n+1))
+            with open(path, 'w') as fh:
+                fh.write(score)
+            paths.append(path)
+        mei = MusicXMLtoMei(input_paths=paths).convert()
+
+        workers = min(args.movements, os.cpu_count() or 1)
+        benchmarks = [
+            ('musicxml -> mei', lambda w: MusicXMLtoMei(input_paths=paths, max_workers=w).build()),
+            ('mei -> musicxml', lambda w: MeitoMusicXML(input_str=mei, max_workers=w).convert()),
+        ]
+        for name, convert in benchmarks:
+            sequential = time_call(lambda: convert(1), args.runs)
+            threaded = time_call(lambda: convert(workers), args.runs)
+            print('%-18s %8.1f ms sequential %8.1f ms with %d threads (%.2fx)'
+                  % (name, sequential * 1000, threaded * 1000, workers, sequential / threaded))
+    finally:
+        shutil.rmtree(tmp_dir)
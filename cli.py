@@ -0,0 +1,205 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+# Command line entry point for both conversion directions.
+# The converters (and with them lxml and pymei) are only imported
+# once the direction is known, so argument errors and --help stay fast.
+
+import os
+import sys
+
+# file extensions (after stripping .gz) to file format
+formats = {
+    '.xml': 'musicxml',
+    '.musicxml': 'musicxml',
+    '.mxl': 'musicxml',
+    '.mei': 'mei'
+}
+
+def file_format(path):
+    '''
+    Returns the (format, compression) of a path based on its extension.
+    Format is 'musicxml', 'mei' or None; compression is 'gzip', 'mxl' or None.
+    '''
+
+    name = path.lower()
+    compression = None
+    if name.endswith('.gz'):
+        compression = 'gzip'
+        name = name[:-3]
+
+    _, ext = os.path.splitext(name)
+    if ext == '.mxl':
+        compression = 'mxl'
+
+    return formats.get(ext), compression
+
+def get_converter(input_path, output_path):
+    '''
+    Returns the converter class for the direction given by the file
+    extensions of the input and output paths
+    '''
+
+    input_format, _ = file_format(input_path)
+    output_format, _ = file_format(output_path)
+
+    if input_format == 'musicxml' and output_format == 'mei':
+        from musicxmltomei import MusicXMLtoMei
+        return MusicXMLtoMei
+    elif input_format == 'mei' and output_format == 'musicxml':
+        from meitomusicxml import MeitoMusicXML
+        return MeitoMusicXML
+    else:
+        raise ValueError('Cannot convert %s to %s: expected MusicXML (.xml, .musicxml, .mxl) to MEI (.mei) or the reverse, optionally gzipped (.gz)' % (input_path, output_path))
+
+def convert_file(input_path, output_path, **kwargs):
+    '''
+    Converts a file in the direction given by the file extensions,
+    reading and writing compressed files where needed. Extra keyword
+    arguments are passed on to the converter. Returns the converter,
+    whose output_paths lists every file written.
+    '''
+
+    converter_cls = get_converter(input_path, output_path)
+    _, input_compression = file_format(input_path)
+    _, output_compression = file_format(output_path)
+
+    if input_compression is None:
+        kwargs['input_path'] = input_path
+    else:
+        kwargs['input_buffer'] = _read_compressed(input_path, input_compression)
+
+    if output_compression is None:
+        kwargs['output_path'] = output_path
+        converter = converter_cls(**kwargs)
+        converter.convert()
+    else:
+        converter = converter_cls(**kwargs)
+        output = converter.convert()
+        if isinstance(output, list):
+            raise ValueError('Multi-movement output is written as one file per movement and cannot be compressed')
+        if not isinstance(output, bytes):
+            output = output.encode('utf-8')
+        _write_compressed(output_path, output_compression, output)
+        converter.output_paths.append(output_path)
+
+    return converter
+
+def _read_compressed(path, compression):
+    if compression == 'gzip':
+        import gzip
+        with gzip.open(path, 'rb') as fh:
+            return fh.read()
+
+    # compressed musicxml: zip archive whose container lists the score
+    import zipfile
+    with zipfile.ZipFile(path) as archive:
+        names = archive.namelist()
+        score_path = None
+        if 'META-INF/container.xml' in names:
+            from lxml import etree
+            container = etree.fromstring(archive.read('META-INF/container.xml'))
+            rootfiles = container.xpath("//*[local-name()='rootfile']/@full-path")
+            if rootfiles:
+                score_path = rootfiles[0]
+        if score_path is None:
+            score_path = [n for n in names if not n.startswith('META-INF/') and n.endswith('.xml')][0]
+
+        return archive.read(score_path)
+
+def _write_compressed(path, compression, data):
+    if compression == 'gzip':
+        import gzip
+        with gzip.open(path, 'wb') as fh:
+            fh.write(data)
+        return
+
+    import zipfile
+    score_path = os.path.splitext(os.path.basename(path))[0] + '.xml'
+    container = ('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<container>\n'
+                 '  <rootfiles>\n'
+                 '    <rootfile full-path="%s"/>\n'
+                 '  </rootfiles>\n'
+                 '</container>\n') % score_path
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('META-INF/container.xml', container)
+        archive.writestr(score_path, data)
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == 'sync':
+        from sync import main as sync_main
+        return sync_main(argv[1:])
+
+    import argparse
+
+    # set up command line argument structure
+    parser = argparse.ArgumentParser(description='Convert a MEI to MusicXML or MusicXML to MEI. The direction is chosen from the file extensions.')
+    parser.add_argument('filein', help='input file')
+    parser.add_argument('fileout', help='output file')
+    parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
+    parser.add_argument('--partwise', help='write score-partwise MusicXML', action='store_true')
+    parser.add_argument('--stream', help='write partwise MusicXML measure by measure', action='store_true')
+    parser.add_argument('--memo-size', help='cache up to this many converted measures', type=int, default=0)
+    parser.add_argument('--engine', help='conversion strategy, chosen from the input by default', choices=['auto', 'memory', 'stream', 'parallel'], default='auto')
+    parser.add_argument('--memory-budget', help='memory budget in megabytes for choosing the strategy', type=int, default=1024)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.filein):
+        parser.error('The input file does not exist')
+
+    kwargs = {
+        'memo_size': args.memo_size,
+        'engine': args.engine,
+        'memory_budget': args.memory_budget << 20
+    }
+    if args.partwise or args.stream:
+        kwargs['output_format'] = 'partwise'
+    if args.stream:
+        args.engine = kwargs['engine'] = 'stream'
+    if args.engine == 'stream' and file_format(args.fileout)[1] is not None:
+        parser.error('The stream engine writes the output file measure by measure and cannot compress it')
+
+    try:
+        converter_cls = get_converter(args.filein, args.fileout)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.engine != 'auto' and args.engine not in converter_cls.engines:
+        parser.error('%s supports the engines: auto, %s' % (converter_cls.__name__, ', '.join(converter_cls.engines)))
+    if args.engine == 'stream' and 'output_format' not in kwargs:
+        parser.error('The stream engine writes partwise output, pass --partwise or --stream')
+
+    converter = convert_file(args.filein, args.fileout, **kwargs)
+
+    if args.verbose:
+        sys.stderr.write('%s: %s -> %s\n' % (type(converter).__name__, args.filein, args.fileout))
+        if converter.stats:
+            sys.stderr.write('stats: %s\n' % converter.stats)
+        if converter.memo is not None:
+            sys.stderr.write('measure cache: %s\n' % converter.memo.stats())
+        if converter.unhandled:
+            sys.stderr.write('skipped elements: %s\n' % dict(converter.unhandled))
+
+if __name__ == '__main__':
+    main()
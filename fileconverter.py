@@ -20,41 +20,473 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 '''
 
+import os
+import contextlib
+import functools
+import hashlib
 import re
+import threading
+import weakref
+from collections import Counter, OrderedDict
 from lxml import etree
 from pymei import MeiDocument, MeiElement, XmlExport, XmlImport
 
-import argparse
-
-# set up command line argument structure
-parser = argparse.ArgumentParser(description='Convert a MEI to MusicXML or MusicXML to MEI.')
-parser.add_argument('filein', help='input file')
-parser.add_argument('fileout', help='output file')
-parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
-
 class FileConverter(object):
     
-    to_timewise_xslt_path = '/Users/gburlet/University/MA/musicxmlmeiconversion/partwisetotimewise.xslt'
+    to_timewise_xslt_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'partwisetotimewise.xslt')
     pitch_classes = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
+    # element name to handler, either the name of a method or a function
+    # taking the converter as first argument; see register_handler
+    handlers = {}
+
+    # conversion strategies a converter supports, see _select_engine;
+    # 'parallel' hands movements to a thread pool of max_workers
+    engines = ('memory', 'parallel')
+    # byte patterns the header probe counts to estimate the size of a score
+    probe_patterns = {}
+    # bytes read from the start of each input by the header probe
+    probe_size = 1 << 20
+    # approximate size of the parsed input tree relative to the input size
+    tree_size_factor = 10
+    # approximate size of the output tree relative to the input size
+    output_size_factor = 10
+    # approximate number of part-measures worth converting movements in parallel
+    parallel_threshold = 1000
+
+    # bytes handed to the feed parser at a time
+    feed_size = 1 << 16
+
+    # mei elements _parse_mei fingerprints for the memo while the source
+    # text is at hand, which is much cheaper than walking the pymei tree
+    memo_elements = ()
+    xml_id_pattern = re.compile(br'\sxml:id="[^"]*"')
+
+    # maximum number of conversions convert_async lets run at the same time
+    max_concurrent = 4
+    _executor = None
+    _semaphores = weakref.WeakKeyDictionary()
+
     def __init__(self, **kwargs):
         # for file in, file out scenarios
         if 'input_path' in kwargs:
             self.input_path = kwargs['input_path']
         elif 'input_str' in kwargs:
             self.input_str = kwargs['input_str']
+        elif 'input_buffer' in kwargs:
+            # bytes, bytearray, memoryview, mmap or any other buffer-protocol object
+            self.input_buffer = kwargs['input_buffer']
+        elif 'input_paths' in kwargs:
+            # one file per movement
+            self.input_paths = kwargs['input_paths']
+        elif 'input_doc' in kwargs:
+            # in-memory document handed over from another converter
+            self.input_doc = kwargs['input_doc']
+        elif 'input_stream' in kwargs:
+            # asyncio stream (anything with a coroutine read()), consumed by convert_async
+            self.input_stream = kwargs['input_stream']
         else:
             raise ValueError('Some input is needed to process.')
 
         if 'output_path' in kwargs:
             self.output_path = kwargs['output_path']
 
+        # resolve the handlers once into a dispatch table of bound callables
+        self._dispatch = {}
+        for name, handler in type(self).handlers.items():
+            if isinstance(handler, str):
+                self._dispatch[name] = getattr(self, handler)
+            else:
+                self._dispatch[name] = functools.partial(handler, self)
+
+        # number of elements without a handler, by element name;
+        # movements may be converted from several threads
+        self.unhandled = Counter()
+        self._lock = threading.Lock()
+        # thread id to the counter of a _recording_unhandled block
+        self._recorders = {}
+
+        # threads handling movements at the same time; pymei and most lxml
+        # element building hold the GIL, so only the work lxml does without
+        # it (parsing, xslt, serialising) overlaps and the default is one
+        self.max_workers = kwargs.get('max_workers') or 1
+
+        # conversion strategy: None keeps the options above as given, 'auto'
+        # chooses one from the input, or pin one of the class's engines
+        self.engine = kwargs.get('engine')
+        if self.engine is not None and self.engine != 'auto' and self.engine not in self.engines:
+            raise ValueError('%s supports the engines: auto, %s' % (type(self).__name__, ', '.join(self.engines)))
+        self.memory_budget = kwargs.get('memory_budget', 1 << 30)
+
+        # information about the last conversion, e.g. the engine used
+        self.stats = {}
+
+        # files the conversion wrote, and other files it read besides the
+        # input itself, e.g. the scores of an opus
+        self.output_paths = []
+        self.dependencies = []
+
+        # optional cache of converted measure content, holding at most memo_size entries;
+        # on a hit the handlers do not run, their unhandled counts are replayed
+        self.memo = None
+        if kwargs.get('memo_size'):
+            self.memo = MeasureCache(kwargs['memo_size'])
+        # xml:id of a parsed memo element to the fingerprint of its source
+        self._fingerprints = {}
+
+    def __getstate__(self):
+        # locks cannot be pickled, e.g. to hand the converter to a process pool
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _select_engine(self, streaming=True):
+        '''
+        Chooses the conversion strategy when an engine was requested, from a
+        cheap probe of the input, the cpu count and the memory budget, and
+        records the choice, the probe and the memory the engine is
+        estimated to hold in the stats. Streaming is only considered if the
+        caller can write streamed output.
+        '''
+
+        if self.engine is None:
+            return
+
+        probe = self._probe()
+        engine = self.engine
+        if engine == 'auto':
+            engine = self._choose_engine(probe, streaming)
+        self._apply_engine(engine)
+
+        self.stats.update(probe)
+        self.stats['engine'] = engine
+        self.stats['estimated_memory'] = self._estimate_memory(probe, engine)
+
+    def _estimate_memory(self, probe, engine):
+        '''
+        Returns the estimated peak memory of an engine: every engine holds
+        the whole input tree, only the stream engine avoids the output tree
+        '''
+
+        if engine == 'stream':
+            return probe['input_memory']
+        return probe['input_memory'] + probe['output_memory']
+
+    def _choose_engine(self, probe, streaming):
+        # streaming saves the output tree only, so it is chosen even if
+        # the input tree alone exceeds the budget: it is the best on offer
+        if (streaming and 'stream' in self.engines and self._can_stream()
+                and self._estimate_memory(probe, 'memory') > self.memory_budget):
+            return 'stream'
+
+        if ('parallel' in self.engines and probe['cpu_count'] > 1 and probe['movements'] > 1
+                and probe['parts'] * probe['measures'] >= self.parallel_threshold):
+            return 'parallel'
+
+        return 'memory'
+
+    def _apply_engine(self, engine):
+        if engine == 'memory':
+            self.max_workers = 1
+        elif engine == 'parallel' and self.max_workers < 2:
+            self.max_workers = os.cpu_count() or 1
+
+    def _can_stream(self):
+        return False
+
+    def _probe(self):
+        '''
+        Estimates the size of the input without parsing it: the byte size,
+        and the number of parts, measures and movements counted in the first
+        probe_size bytes of each input, extrapolated to the whole input
+        '''
+
+        inputs = self._probe_inputs()
+
+        counts = {'parts': 0, 'measures': 0, 'movements': 0}
+        size = 0
+        for input_size, input_counts in inputs:
+            size += input_size
+            counts['parts'] = max(counts['parts'], input_counts['parts'])
+            counts['measures'] += input_counts['measures']
+            counts['movements'] += input_counts['movements']
+
+        movements = max(counts['movements'], len(inputs), 1)
+
+        return {
+            'input_size': size,
+            'input_memory': size * self.tree_size_factor,
+            'output_memory': size * self.output_size_factor,
+            'parts': counts['parts'],
+            'measures': counts['measures'],
+            'movements': movements,
+            'cpu_count': os.cpu_count() or 1,
+            'memory_budget': self.memory_budget
+        }
+
+    def _probe_inputs(self):
+        '''
+        Returns the byte size and the probe counts of every input
+        '''
+
+        return [(size, self._probe_sample(sample, size)) for size, sample in self._probe_samples()]
+
+    def _probe_samples(self):
+        '''
+        Returns the byte size and the first probe_size bytes of every input
+        '''
+
+        if hasattr(self, 'input_paths'):
+            samples = [(os.path.getsize(p), self._read_sample(p)) for p in self.input_paths]
+        elif hasattr(self, 'input_path'):
+            samples = [(os.path.getsize(self.input_path), self._read_sample(self.input_path))]
+        elif hasattr(self, 'input_buffer'):
+            view = memoryview(self.input_buffer).cast('B')
+            samples = [(view.nbytes, view[:self.probe_size].tobytes())]
+        elif hasattr(self, 'input_str'):
+            data = self.input_str
+            if isinstance(data, bytes):
+                samples = [(len(data), data[:self.probe_size])]
+            else:
+                # encode the sample only; the byte size of the rest is
+                # extrapolated from it unless the string is plain ascii
+                sample = data[:self.probe_size].encode('utf-8')
+                if data.isascii():
+                    size = len(data)
+                else:
+                    size = int(len(data) * float(len(sample)) / max(min(len(data), self.probe_size), 1))
+                samples = [(size, sample[:self.probe_size])]
+        else:
+            # in-memory documents are already parsed
+            samples = []
+
+        return samples
+
+    def _probe_sample(self, sample, file_size):
+        '''
+        Counts the probe patterns in the sample of an input of the given
+        size. Parts are listed in the header and counted as found; the
+        other counts are extrapolated to the whole input.
+        '''
+
+        scale = float(file_size) / len(sample) if sample else 1.0
+        counts = {'parts': 0, 'measures': 0, 'movements': 0}
+        for name, pattern in self.probe_patterns.items():
+            count = sample.count(pattern)
+            if name == 'parts':
+                counts[name] = count
+            else:
+                counts[name] = int(count * scale)
+
+        return counts
+
+    def _read_sample(self, path):
+        with open(path, 'rb') as fh:
+            return fh.read(self.probe_size)
+
+    def _input_chunks(self, path=None):
+        '''
+        Yields the input, or the file at path, in chunks for the feed parser.
+        Files are memory-mapped and buffers are sliced through a memoryview,
+        so at most feed_size bytes are copied at a time. Strings are sliced
+        too: libxml2 refuses a single feed larger than about 10 MB.
+        '''
+
+        if path is None and hasattr(self, 'input_path'):
+            path = self.input_path
+
+        if path is not None:
+            with open(path, 'rb') as fh:
+                size = os.fstat(fh.fileno()).st_size
+                if size == 0:
+                    return
+
+                import mmap
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    for start in range(0, size, self.feed_size):
+                        yield mapped[start:start+self.feed_size]
+                finally:
+                    mapped.close()
+            return
+
+        if hasattr(self, 'input_buffer'):
+            data = self.input_buffer
+        else:
+            data = self.input_str
+
+        if isinstance(data, str):
+            for start in range(0, len(data), self.feed_size):
+                yield data[start:start+self.feed_size]
+            return
+
+        view = memoryview(data).cast('B')
+        for start in range(0, view.nbytes, self.feed_size):
+            yield view[start:start+self.feed_size].tobytes()
+
+    def _parse_xml(self, path=None):
+        '''
+        Parses the input, or the file at path, to an lxml root element
+        '''
+
+        parser = etree.XMLParser()
+        for chunk in self._input_chunks(path):
+            parser.feed(chunk)
+
+        return parser.close()
+
+    def _parse_mei(self, path=None):
+        '''
+        Parses the input, or the file at path, to a MeiDocument. The mei
+        elements are built from the parser events and each lxml element is
+        discarded once it has been read, so only the mei tree is kept.
+        '''
+
+        parser = etree.XMLPullParser(events=('start', 'end'))
+        stack = []
+        root = None
+        fingerprint = self.memo is not None and self.memo_elements
+        # memo elements being read, their lxml children are kept until they end
+        kept = [0]
+        # the element read last, whose tail text is complete at the next event
+        last = [None]
+
+        def read_events():
+            for event, el in parser.read_events():
+                if not isinstance(el.tag, str):
+                    continue
+
+                if last[0] is not None:
+                    last_el, last_element = last[0]
+                    if last_el.tail and last_el.tail.strip():
+                        last_element.setTail(last_el.tail)
+                    last[0] = None
+
+                if event == 'start':
+                    element = MeiElement(etree.QName(el).localname)
+                    prefixes = dict((uri, prefix) for prefix, uri in el.nsmap.items())
+                    for name, value in el.attrib.items():
+                        if name == '{http://www.w3.org/XML/1998/namespace}id':
+                            element.setId(value)
+                            continue
+                        qname = etree.QName(name)
+                        if qname.namespace is not None and prefixes.get(qname.namespace):
+                            name = prefixes[qname.namespace] + ':' + qname.localname
+                        elif qname.namespace == 'http://www.w3.org/XML/1998/namespace':
+                            name = 'xml:' + qname.localname
+                        else:
+                            name = qname.localname
+                        element.addAttribute(name, value)
+
+                    if stack:
+                        stack[-1].addChild(element)
+                    stack.append(element)
+                    if fingerprint and element.getName() in self.memo_elements:
+                        kept[0] += 1
+                else:
+                    element = stack.pop()
+                    if el.text and el.text.strip():
+                        element.setValue(el.text)
+
+                    if fingerprint and element.getName() in self.memo_elements:
+                        kept[0] -= 1
+                        source = FileConverter.xml_id_pattern.sub(b'', etree.tostring(el, with_tail=False))
+                        self._fingerprints[element.getId()] = hashlib.sha1(source).digest()
+
+                    if not kept[0]:
+                        # free the lxml element and the siblings read before it,
+                        # keeping the tail the parser may not have read yet
+                        el.clear(keep_tail=True)
+                        while el.getprevious() is not None:
+                            del el.getparent()[0]
+                    last[0] = (el, element)
+
+                    if not stack:
+                        yield element
+
+        for chunk in self._input_chunks(path):
+            parser.feed(chunk)
+            for element in read_events():
+                root = element
+        parser.close()
+        for element in read_events():
+            root = element
+
+        meidoc = MeiDocument()
+        meidoc.setRootElement(root)
+
+        return meidoc
+
+    @classmethod
+    def register_handler(cls, name, handler):
+        '''
+        Registers a handler for elements with the given name, replacing any
+        existing one. The handler is called as handler(converter, element, ...)
+        with the same extra arguments as the built-in handlers of the class.
+        Applies to converters created afterwards. With a memo, handlers do
+        not run for content that is served from the cache, so they should
+        only act through their arguments.
+        '''
+
+        # copy so registering on a subclass does not change its parent
+        cls.handlers = dict(cls.handlers)
+        cls.handlers[name] = handler
+
+    def _handle(self, name, element, *args):
+        '''
+        Helper method to dispatch an element to its handler.
+        Elements without a handler are counted and skipped.
+        '''
+
+        handler = self._dispatch.get(name)
+        if handler is None:
+            with self._lock:
+                self.unhandled[name] += 1
+                recorder = self._recorders.get(threading.get_ident())
+                if recorder is not None:
+                    recorder[name] += 1
+            return None
+
+        return handler(element, *args)
+
+    @contextlib.contextmanager
+    def _recording_unhandled(self):
+        '''
+        Helper context manager that yields a Counter of the elements without
+        a handler the current thread meets inside the block, e.g. to replay
+        them for content served from the memo
+        '''
+
+        counts = Counter()
+        ident = threading.get_ident()
+        with self._lock:
+            self._recorders[ident] = counts
+        try:
+            yield counts
+        finally:
+            with self._lock:
+                del self._recorders[ident]
+
+    def _count_unhandled(self, counts):
+        '''
+        Helper method to add counts of elements without a handler
+        '''
+
+        with self._lock:
+            self.unhandled.update(counts)
+
     def _get_text(self, element):
         '''
         Helper method to get the text of an element 
-        returned by an xpath query
+        returned by an xpath query, None if nothing matched
         '''
         if type(element) is list:
+            if not element:
+                return None
             element = element[0]
 
         if element is not None:
@@ -78,3 +510,165 @@ class FileConverter(object):
                 return False
 
         return True
+
+    def _clone_mei_element(self, element):
+        '''
+        Helper method to deep copy a mei element and its children.
+        The copies receive new xml:ids.
+        '''
+
+        clone = MeiElement(element.getName())
+        for a in element.getAttributes():
+            clone.addAttribute(a.getName(), a.getValue())
+        if element.getValue():
+            clone.setValue(element.getValue())
+        if element.getTail():
+            clone.setTail(element.getTail())
+        for c in element.getChildren():
+            clone.addChild(self._clone_mei_element(c))
+
+        return clone
+
+    def _mei_fingerprint(self, element):
+        '''
+        Helper method to get a hashable fingerprint of a mei element and its
+        children: names, attributes, values and tails, ignoring xml:ids.
+        '''
+
+        attrs = tuple(sorted((a.getName(), a.getValue()) for a in element.getAttributes() if a.getName() != 'xml:id'))
+        children = tuple(self._mei_fingerprint(c) for c in element.getChildren())
+
+        return (element.getName(), attrs, element.getValue(), element.getTail(), children)
+
+    async def convert_async(self, executor=None, writer=None):
+        '''
+        Coroutine version of convert() for use inside an asyncio event loop.
+
+        The conversion runs in an executor (a shared thread pool by default,
+        pass a ProcessPoolExecutor for CPU bound workloads) and at most
+        FileConverter.max_concurrent conversions run at once per event loop.
+        Returns the converted document as bytes (a list of bytes, one per
+        movement, for multi-movement MusicXML output), or writes it to the
+        asyncio stream writer if one is given; multi-movement output cannot
+        be written to a stream. Cancelling the coroutine cancels the
+        conversion if it has not started yet; a conversion that is
+        already running keeps its slot until it finishes.
+        '''
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+
+        # take a slot before reading the input stream, so waiting
+        # conversions do not hold their input in memory
+        semaphore = FileConverter._get_semaphore(loop)
+        await semaphore.acquire()
+        try:
+            if hasattr(self, 'input_stream'):
+                self.input_str = await self.input_stream.read()
+                del self.input_stream
+            future = (executor or FileConverter._get_executor()).submit(_run_convert, self)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(_):
+            try:
+                loop.call_soon_threadsafe(semaphore.release)
+            except RuntimeError:
+                # event loop already closed
+                pass
+        future.add_done_callback(release)
+
+        result = await asyncio.wrap_future(future)
+        if isinstance(result, list):
+            result = [r.encode('utf-8') if isinstance(r, str) else r for r in result]
+        elif isinstance(result, str):
+            result = result.encode('utf-8')
+
+        if writer is not None and result is not None:
+            if isinstance(result, list):
+                raise ValueError('Multi-movement output is one document per movement and cannot be written to a single stream')
+            writer.write(result)
+            await writer.drain()
+        else:
+            return result
+
+    @staticmethod
+    def _get_executor():
+        if FileConverter._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            FileConverter._executor = ThreadPoolExecutor(max_workers=FileConverter.max_concurrent)
+        return FileConverter._executor
+
+    @staticmethod
+    def _get_semaphore(loop):
+        semaphore = FileConverter._semaphores.get(loop)
+        if semaphore is None:
+            import asyncio
+            semaphore = asyncio.Semaphore(FileConverter.max_concurrent)
+            FileConverter._semaphores[loop] = semaphore
+        return semaphore
+
+class MeasureCache(object):
+    '''
+    Bounded least recently used cache of converted measure content,
+    keyed by a fingerprint of the source events and their context
+    '''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # movements may be converted from several threads
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # locks cannot be pickled, e.g. to hand a converter to a process pool
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''
+        Returns the cached content for the key, or None on a miss
+        '''
+
+        with self._lock:
+            content = self._entries.get(key)
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+        return content
+
+    def put(self, key, content):
+        with self._lock:
+            self._entries[key] = content
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'hit_rate': float(self.hits) / lookups if lookups else 0.0
+        }
+
+def _run_convert(converter):
+    '''
+    Executor entry point for convert_async, module level so
+    it can be pickled for process pools
+    '''
+
+    return converter.convert()
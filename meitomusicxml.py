@@ -22,6 +22,8 @@ THE SOFTWARE.
 
 from fileconverter import *
 import os
+import copy
+from fractions import Fraction
 
 class MeitoMusicXML(FileConverter):
 
@@ -42,27 +44,274 @@ class MeitoMusicXML(FileConverter):
         'breve': 'breve'
     }
 
+    doctypes = {
+        'score-timewise': '<!DOCTYPE score-timewise PUBLIC "-//Recordare//DTD MusicXML 2.0 Timewise//EN" "musicxml20/timewise.dtd">',
+        'score-partwise': '<!DOCTYPE score-partwise PUBLIC "-//Recordare//DTD MusicXML 2.0 Partwise//EN" "musicxml20/partwise.dtd">',
+        'opus': '<!DOCTYPE opus PUBLIC "-//Recordare//DTD MusicXML 2.0 Opus//EN" "musicxml20/opus.dtd">'
+    }
+
+    # written durations in quarter notes, other than 1/n of a whole note
+    dur_quarters = {
+        'long': 16,
+        'breve': 8
+    }
+
+    engines = ('memory', 'stream', 'parallel')
+
+    probe_patterns = {
+        'parts': b'<staffDef',
+        'measures': b'<measure',
+        'movements': b'<mdiv'
+    }
+
+    # staves are memoised, see _memo_notes
+    memo_elements = ('staff',)
+
+    # handlers of the events of a layer, see FileConverter.register_handler;
+    # called with the musicxml notes built so far and the divisions per
+    # quarter note, they return the duration of the event in divisions
+    handlers = {
+        'note': '_handle_note',
+        'chord': '_handle_chord',
+        'rest': '_handle_rest',
+        'space': '_handle_space',
+        'beam': '_handle_container',
+        'tuplet': '_handle_container'
+    }
 
     def __init__(self, **kwargs):
         super(MeitoMusicXML, self).__init__(**kwargs)
 
+        if hasattr(self, 'input_paths'):
+            raise ValueError('MeitoMusicXML reads a single mei document, input_paths is not supported.')
+
+        # 'timewise' or 'partwise'
+        self.output_format = kwargs.get('output_format', 'timewise')
+        if self.output_format not in ('timewise', 'partwise'):
+            raise ValueError('Output format must be timewise or partwise.')
+
+        # write partwise output measure by measure instead of building the whole
+        # output tree; the mei input is still parsed into memory as a whole
+        self.stream = kwargs.get('stream', False)
+
     def convert(self):
-        # read input mei file
-        if hasattr(self, 'input_path'):
-            self.meidoc = XmlImport.documentFromFile(self.input_path)
+        self._select_engine()
+        if self.stream:
+            if self.output_format != 'partwise' or not hasattr(self, 'output_path'):
+                raise ValueError('Streaming output requires partwise output to an output path.')
+            self._read_input()
+            mdivs = self._get_mdivs()
+            paths = self._movement_paths(len(mdivs))
+            self._map_movements(lambda i: self._write_partwise_stream(mdivs[i], paths[i]), range(len(mdivs)))
+            if len(mdivs) > 1:
+                self._write_opus(paths)
         else:
-            self.meidoc = XmlImport.documentFromText(self.input_str)
+            return self._export(self._build_movements())
+
+    def build(self):
+        '''
+        Converts the input to an in-memory lxml MusicXML tree without serialising it.
+        A mei document with several mdivs gives a list of trees, one per movement.
+        '''
+
+        self._select_engine(streaming=False)
+        if self.stream:
+            raise ValueError('Streaming output is written by convert, not built in memory.')
+
+        return self._build_movements()
+
+    def _build_movements(self):
+        self._read_input()
+        roots = self._map_movements(self._build_movement, self._get_mdivs())
+        if len(roots) == 1:
+            return roots[0]
+
+        return roots
+
+    def _apply_engine(self, engine):
+        super(MeitoMusicXML, self)._apply_engine(engine)
+        self.stream = engine == 'stream'
+        if self.stream and self.output_format != 'partwise':
+            raise ValueError("The stream engine writes partwise output, pass output_format='partwise'.")
+
+    def _can_stream(self):
+        return self.output_format == 'partwise' and hasattr(self, 'output_path')
+
+    def _get_mdivs(self):
+        '''
+        Returns the mdivs holding a score, in document order
+        '''
+
+        mdivs = [m for m in self.meidoc.getElementsByName('mdiv') if m.getChildrenByName('score')]
+        if not mdivs:
+            # no movements, convert the whole document
+            mdivs = [self.meidoc.getRootElement()]
+
+        return mdivs
+
+    def _map_movements(self, func, movements):
+        '''
+        Applies func to every movement and returns the results in order.
+        With max_workers > 1 a thread pool overlaps the serialisation and
+        file writes of the movements; reading the mei tree holds the GIL.
+        '''
+
+        movements = list(movements)
+        if len(movements) > 1 and self.max_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(movements))) as executor:
+                return list(executor.map(func, movements))
+
+        return [func(m) for m in movements]
+
+    def _build_movement(self, mdiv):
+        '''
+        Converts one mei mdiv to a musicxml tree
+        '''
+
+        staff_defs = mdiv.getDescendantsByName('staffDef')
 
         # begin constructing XML document
-        score_timewise = etree.Element('score-timewise')
+        root = etree.Element('score-' + self.output_format)
+        for e in self._create_header(staff_defs, self._movement_title(mdiv)):
+            root.append(e)
+
+        # parse music data
+        measures = mdiv.getDescendantsByName('measure')
+        if self.output_format == 'partwise':
+            # build part/measure directly, appending each measure to its part in one pass
+            parts = []
+            for sd_ind in range(len(staff_defs)):
+                part = etree.Element('part')
+                part.set('id', 'p' + str(sd_ind))
+                root.append(part)
+                parts.append(part)
+
+            for n, m in enumerate(measures):
+                for s in m.getChildrenByName('staff'):
+                    sd_ind = int(s.getAttribute('n').value) - 1
+                    measure = etree.Element('measure')
+                    measure.set('number', str(n+1))
+                    measure.extend(self._create_part_content(s, staff_defs[sd_ind]))
+                    parts[sd_ind].append(measure)
+        else:
+            for n, m in enumerate(measures):
+                measure = etree.Element('measure')
+                measure.set('number', str(n+1))
+
+                for s in m.getChildrenByName('staff'):
+                    sd_ind = int(s.getAttribute('n').value) - 1
+                    part = etree.Element('part')
+                    part.set('id', 'p' + str(sd_ind))
+                    part.extend(self._create_part_content(s, staff_defs[sd_ind]))
+                    measure.append(part)
+
+                root.append(measure)
+
+        return root
+
+    def _movement_title(self, mdiv):
+        '''
+        Returns the label of the mdiv, or else the work title
+        '''
+
+        if mdiv.hasAttribute('label'):
+            return mdiv.getAttribute('label').value
 
-        # work title
         title = self.meidoc.getElementsByName('title')
         if title:
-            title = title[0].value
+            return title[0].value
+
+    def _movement_paths(self, num_movements):
+        '''
+        Returns the output path of each movement: the output path itself
+        for a single movement, otherwise numbered files next to it
+        '''
+
+        if num_movements == 1:
+            return [self.output_path]
+
+        base, ext = os.path.splitext(self.output_path)
+        return [base + '-' + str(n+1) + ext for n in range(num_movements)]
+
+    def _write_partwise_stream(self, mdiv, output_path):
+        '''
+        Writes score-partwise to the output path part by part,
+        serialising each measure as soon as it is built so the
+        output score is never held in memory as a whole
+        '''
+
+        staff_defs = mdiv.getDescendantsByName('staffDef')
+        measures = mdiv.getDescendantsByName('measure')
+
+        with etree.xmlfile(output_path, encoding='UTF-8') as xf:
+            xf.write_declaration()
+            xf.write_doctype(MeitoMusicXML.doctypes['score-partwise'])
+            with xf.element('score-partwise'):
+                for e in self._create_header(staff_defs, self._movement_title(mdiv)):
+                    xf.write(e, pretty_print=True)
+
+                # the staves of each measure by staff number, read once
+                measure_staves = []
+                for m in measures:
+                    measure_staves.append(dict((s.getAttribute('n').value, s) for s in m.getChildrenByName('staff')))
+
+                for sd_ind in range(len(staff_defs)):
+                    n_staff = str(sd_ind+1)
+                    with xf.element('part', id='p' + str(sd_ind)):
+                        for n, staves in enumerate(measure_staves):
+                            s = staves.get(n_staff)
+                            if s is None:
+                                continue
+                            measure = etree.Element('measure')
+                            measure.set('number', str(n+1))
+                            measure.extend(self._create_part_content(s, staff_defs[sd_ind]))
+                            xf.write(measure, pretty_print=True)
+
+        with self._lock:
+            self.output_paths.append(output_path)
+
+    def _write_opus(self, paths):
+        '''
+        Writes a musicxml opus listing the movement files to the output path
+        '''
+
+        xlink = 'http://www.w3.org/1999/xlink'
+        opus = etree.Element('opus', nsmap={'xlink': xlink})
+
+        title = self.meidoc.getElementsByName('title')
+        if title:
+            opus_title = etree.Element('title')
+            opus_title.text = title[0].value
+            opus.append(opus_title)
+
+        for path in paths:
+            score = etree.Element('score')
+            score.set('{%s}href' % xlink, os.path.basename(path))
+            opus.append(score)
+
+        self._write_file(self.output_path, self._serialise(opus))
+
+    def _read_input(self):
+        # read input mei file
+        if hasattr(self, 'input_doc'):
+            self.meidoc = self.input_doc
+        else:
+            self.meidoc = self._parse_mei()
+
+    def _create_header(self, staff_defs, title):
+        '''
+        Creates the musicxml elements preceding the music data:
+        movement title, identification, encoding and part-list
+        '''
+
+        header = []
+
+        # work or movement title
+        if title:
             movement_title = etree.Element('movement-title')
             movement_title.text = title
-            score_timewise.append(movement_title)
+            header.append(movement_title)
 
         # identification
         identification = etree.Element('identification')
@@ -73,7 +322,7 @@ class MeitoMusicXML(FileConverter):
             creator.set('type', role)
             creator.text = p.value
             identification.append(creator)
-        score_timewise.append(identification)
+        header.append(identification)
 
         # encoder
         encoding = etree.Element('encoding')
@@ -83,11 +332,10 @@ class MeitoMusicXML(FileConverter):
             software = etree.Element('software')
             software.text = application
             encoding.append(software)
-        score_timewise.append(encoding)
+        header.append(encoding)
 
         # part-list
         part_list = etree.Element('part-list')
-        staff_defs = self.meidoc.getElementsByName('staffDef')
         for n, sd in enumerate(staff_defs):
             score_part = etree.Element('score-part')
             pid = 'p' + str(n)
@@ -96,7 +344,7 @@ class MeitoMusicXML(FileConverter):
             part_name = etree.Element('part-name')
             name = sd.getAttribute('label.full').value
             part_name.text = name
-            
+
             instr_def = sd.getChildrenByName('instrDef')
             if len(instr_def):
                 instr_def = instr_def[0]
@@ -121,157 +369,318 @@ class MeitoMusicXML(FileConverter):
             score_part.append(score_instr)
             score_part.append(midi_instr)
 
-        score_timewise.append(part_list)
+        header.append(part_list)
 
-        # parse music data
-        measures = self.meidoc.getElementsByName('measure')
-        for n, m in enumerate(measures):
-            measure = etree.Element('measure')
-            measure.set('number', str(n+1))
-
-            staves = m.getChildrenByName('staff')
-            for s in staves:
-                # translate only first layer
-                l = s.getChildrenByName('layer')[0]
-                events = l.getChildren()
-
-                sd_ind = int(s.getAttribute('n').value) - 1
-                pid = 'p' + str(sd_ind)
-                part = etree.Element('part')
-                part.set('id', pid)
-                measure.append(part)
-
-                # append part information
-                attributes = etree.Element('attributes')
-                sd = staff_defs[sd_ind]
-                if sd.hasAttribute('ppq'):
-                    ppq = sd.getAttribute('ppq').value
-                    divisions = etree.Element('divisions')
-                    divisions.text = ppq
-                    attributes.append(divisions)
-
-                if sd.hasAttribute('key.sig') and sd.hasAttribute('key.mode'):
-                    key = etree.Element('key')
-
-                    key_sig = sd.getAttribute('key.sig').value
-                    fifths = etree.Element('fifths')
-                    fifths.text = key_sig
-                    key.append(fifths)
-
-                    key_mode = sd.getAttribute('key.mode').value
-                    mode = etree.Element('mode')
-                    mode.text = key_mode
-                    key.append(mode)
-
-                    attributes.append(key)
-
-                # get last score_def
-                score_def = self.meidoc.lookBack(s, 'scoreDef')
-                if score_def:
-                    time = etree.Element('time')
-                    if score_def.hasAttribute('meter.count'):
-                        meter_count = score_def.getAttribute('meter.count').value
-                        beats = etree.Element('beats')
-                        beats.text = meter_count
-                        time.append(beats)
-                    if score_def.hasAttribute('meter.unit'):
-                        meter_unit = score_def.getAttribute('meter.unit').value
-                        beat_type = etree.Element('beat-type')
-                        beat_type.text = meter_unit
-                        time.append(beat_type)
-
-                    attributes.append(time)
-
-                # clef.shape & clef.line
-                clef = etree.Element('clef')
-                if sd.hasAttribute('clef.shape'):
-                    clef_shape = sd.getAttribute('clef.shape').value
-                    sign = etree.Element('sign')
-                    sign.text = clef_shape
-                    clef.append(sign)
-
-                    if sd.hasAttribute('clef.line'):
-                        clef_line = sd.getAttribute('clef.line').value
-                        line = etree.Element('line')
-                        line.text = clef_line
-                        clef.append(line)
-                attributes.append(clef)
-
-                # tuning
-                if sd.hasAttribute('tab.strings'):
-                    staff_details = etree.Element('staff-details')
-                    tab_strings = str(sd.getAttribute('tab.strings').value)
-                    strings = tab_strings.split()
-                    strings.reverse()
-
-                    staff_lines = etree.Element('staff-lines')
-                    staff_lines.text = str(len(strings))
-                    staff_details.append(staff_lines)
-
-                    for string_ind, strs in enumerate(strings):
-                        staff_tuning = etree.Element('staff-tuning')
-                        staff_tuning.set('line', str(string_ind+1))
-
-                        pname = strs[:-1]
-                        if pname[-1] == '#' or pname[-1] == 's':
-                            tuning_alter = etree.Element('tuning-alter')
-                            tuning_alter.text = '1'
-                            pname = pname[:-1]
-                            staff_tuning.append(tuning_alter)
-                        if pname[-1] == '-' or pname[-1] == 'f':
-                            tuning_alter = etree.Element('tuning-alter')
-                            tuning_alter.text = '-1'
-                            pname = pname[:-1]
-                            staff_tuning.append(tuning_alter)
-
-                        tuning_step = etree.Element('tuning-step')
-                        tuning_step.text = pname
-                        staff_tuning.append(tuning_step)
-
-                        # musicxml is sounding pitch not written pitch like mei
-                        oct = int(strs[-1]) - 1
-                        tuning_octave = etree.Element('tuning-octave')
-                        tuning_octave.text = str(oct)
-                        staff_tuning.append(tuning_octave)
-
-                        staff_details.append(staff_tuning)
-
-                    attributes.append(staff_details)
-
-
-                part.append(attributes)
-
-                for e in events:
-                    # notes
-                    if e.getName() == 'note':
-                        note = self._note_from_element(e)
-                        part.append(note)
-                    elif e.getName() == 'chord':
-                        c_notes = e.getChildrenByName('note')
-                        for c in c_notes:
-                            note = self._note_from_element(c)
-                            part.append(note)
-                    elif e.getName() == 'rest':
-                        if e.hasAttribute('dur.ges'):
-                            dur_ges = e.getAttribute('dur.ges').value
-                        else:
-                            dur_ges = None
-                        
-                        if e.hasAttribute('dur'):
-                            dur = e.getAttribute('dur').value
-                        else:
-                            dur = None
-
-                        rest = self._create_rest(dur, dur_ges)
-                        part.append(rest)
-                            
-            score_timewise.append(measure)
-
-        doctype = '<?xml version="1.0" encoding="UTF-8"?>\n<!DOCTYPE score-timewise PUBLIC "-//Recordare//DTD MusicXML 2.0 Timewise//EN" "musicxml20/timewise.dtd">'
-        musicxml_str = etree.tostring(score_timewise, pretty_print=True, doctype=doctype)
-        fh = open(self.output_path, 'w')
+        return header
+
+    def _create_part_content(self, s, sd):
+        '''
+        Creates the musicxml attributes and notes of one
+        mei staff in a measure, given its staffDef
+        '''
+
+        # append part information
+        attributes = etree.Element('attributes')
+        if sd.hasAttribute('ppq'):
+            ppq = sd.getAttribute('ppq').value
+            divisions = etree.Element('divisions')
+            divisions.text = ppq
+            attributes.append(divisions)
+
+        if sd.hasAttribute('key.sig') and sd.hasAttribute('key.mode'):
+            key = etree.Element('key')
+
+            key_sig = sd.getAttribute('key.sig').value
+            fifths = etree.Element('fifths')
+            fifths.text = key_sig
+            key.append(fifths)
+
+            key_mode = sd.getAttribute('key.mode').value
+            mode = etree.Element('mode')
+            mode.text = key_mode
+            key.append(mode)
+
+            attributes.append(key)
+
+        # get last score_def
+        score_def = self.meidoc.lookBack(s, 'scoreDef')
+        if score_def:
+            time = etree.Element('time')
+            if score_def.hasAttribute('meter.count'):
+                meter_count = score_def.getAttribute('meter.count').value
+                beats = etree.Element('beats')
+                beats.text = meter_count
+                time.append(beats)
+            if score_def.hasAttribute('meter.unit'):
+                meter_unit = score_def.getAttribute('meter.unit').value
+                beat_type = etree.Element('beat-type')
+                beat_type.text = meter_unit
+                time.append(beat_type)
+
+            attributes.append(time)
+
+        # clef.shape & clef.line
+        clef = etree.Element('clef')
+        if sd.hasAttribute('clef.shape'):
+            clef_shape = sd.getAttribute('clef.shape').value
+            sign = etree.Element('sign')
+            sign.text = clef_shape
+            clef.append(sign)
+
+            if sd.hasAttribute('clef.line'):
+                clef_line = sd.getAttribute('clef.line').value
+                line = etree.Element('line')
+                line.text = clef_line
+                clef.append(line)
+        attributes.append(clef)
+
+        # tuning
+        if sd.hasAttribute('tab.strings'):
+            staff_details = etree.Element('staff-details')
+            tab_strings = str(sd.getAttribute('tab.strings').value)
+            strings = tab_strings.split()
+            strings.reverse()
+
+            staff_lines = etree.Element('staff-lines')
+            staff_lines.text = str(len(strings))
+            staff_details.append(staff_lines)
+
+            for string_ind, strs in enumerate(strings):
+                staff_tuning = etree.Element('staff-tuning')
+                staff_tuning.set('line', str(string_ind+1))
+
+                pname = strs[:-1]
+                if pname[-1] == '#' or pname[-1] == 's':
+                    tuning_alter = etree.Element('tuning-alter')
+                    tuning_alter.text = '1'
+                    pname = pname[:-1]
+                    staff_tuning.append(tuning_alter)
+                if pname[-1] == '-' or pname[-1] == 'f':
+                    tuning_alter = etree.Element('tuning-alter')
+                    tuning_alter.text = '-1'
+                    pname = pname[:-1]
+                    staff_tuning.append(tuning_alter)
+
+                tuning_step = etree.Element('tuning-step')
+                tuning_step.text = pname
+                staff_tuning.append(tuning_step)
+
+                # musicxml is sounding pitch not written pitch like mei
+                oct = int(strs[-1]) - 1
+                tuning_octave = etree.Element('tuning-octave')
+                tuning_octave.text = str(oct)
+                staff_tuning.append(tuning_octave)
+
+                staff_details.append(staff_tuning)
+
+            attributes.append(staff_details)
+
+        content = [attributes]
+
+        # translate every layer, each as its own musicxml voice
+        if self.memo is not None:
+            content.extend(self._memo_notes(sd, s))
+        else:
+            content.extend(self._notes_from_staff(s, self._get_ppq(sd)))
+
+        return content
+
+    def _get_ppq(self, sd):
+        '''
+        Returns the divisions per quarter note of a staffDef, None if unknown
+        '''
+
+        if sd.hasAttribute('ppq'):
+            return int(sd.getAttribute('ppq').value)
+
+    def _notes_from_staff(self, s, ppq=None):
+        '''
+        Creates the musicxml notes of every layer of a mei staff,
+        backing up to the start of the measure between layers
+        '''
+
+        notes = []
+        layers = s.getChildrenByName('layer')
+        pos = 0
+        for i, l in enumerate(layers):
+            voice = None
+            if len(layers) > 1:
+                if l.hasAttribute('n'):
+                    voice = l.getAttribute('n').value
+                else:
+                    voice = str(i+1)
+
+            if pos > 0:
+                notes.append(self._create_time_shift('backup', pos))
+
+            layer_notes, pos = self._notes_from_layer(l, voice, ppq)
+            if pos is None and len(layers) > 1:
+                raise ValueError('Cannot align the layers of staff %s: events have neither dur.ges nor a dur and a staffDef ppq.'
+                                 % s.getAttribute('n').value)
+            notes.extend(layer_notes)
+
+        return notes
+
+    def _notes_from_layer(self, l, voice=None, ppq=None):
+        '''
+        Creates the musicxml notes of a mei layer. Returns the notes and
+        the duration of the layer in divisions, None if it is unknown.
+        '''
+
+        notes = []
+        pos = self._handle_events(l.getChildren(), notes, ppq)
+
+        if voice is not None:
+            for note in notes:
+                if note.tag == 'note':
+                    self._set_voice(note, voice)
+
+        return notes, pos
+
+    def _handle_events(self, elements, notes, ppq):
+        '''
+        Dispatches a sequence of mei events to their handlers. Handlers
+        return the duration of the event in divisions, 0 if it takes no
+        time and None if it is unknown. Returns the total duration, None
+        if any handled event has an unknown duration.
+        '''
+
+        pos = 0
+        for e in elements:
+            name = e.getName()
+            duration = self._handle(name, e, notes, ppq)
+            if duration is None:
+                if name in self._dispatch:
+                    pos = None
+            elif pos is not None:
+                pos += duration
+
+        return pos
+
+    def _handle_note(self, e, notes, ppq):
+        notes.append(self._note_from_element(e, ppq))
+        return self._get_dur_ges(e, ppq)
+
+    def _handle_chord(self, e, notes, ppq):
+        # musicxml marks every chord note but the first with <chord/>
+        for i, c in enumerate(e.getChildrenByName('note')):
+            notes.append(self._note_from_element(c, ppq, member_chord=i > 0))
+        return self._get_dur_ges(e, ppq)
+
+    def _handle_rest(self, e, notes, ppq):
+        if e.hasAttribute('dur'):
+            dur = e.getAttribute('dur').value
+        else:
+            dur = None
+
+        dur_ges = self._get_dur_ges(e, ppq)
+        if dur_ges is None:
+            notes.append(self._create_rest(dur, None))
+        else:
+            notes.append(self._create_rest(dur, str(dur_ges)))
+        return dur_ges
+
+    def _handle_space(self, e, notes, ppq):
+        duration = self._get_dur_ges(e, ppq)
+        if duration:
+            notes.append(self._create_time_shift('forward', duration))
+        return duration
+
+    def _handle_container(self, e, notes, ppq):
+        # beams and tuplets group events without changing them;
+        # a tuplet scales the written durations of its events
+        if ppq is not None and e.getName() == 'tuplet' and e.hasAttribute('num') and e.hasAttribute('numbase'):
+            ppq = Fraction(ppq) * int(e.getAttribute('numbase').value) / int(e.getAttribute('num').value)
+        return self._handle_events(e.getChildren(), notes, ppq)
+
+    def _get_dur_ges(self, e, ppq=None):
+        '''
+        Returns the gestural duration of a mei element in divisions. Without
+        dur.ges it is computed from dur and dots given the divisions per
+        quarter note; None if it cannot be determined.
+        '''
+
+        if e.hasAttribute('dur.ges'):
+            return int(e.getAttribute('dur.ges').value)
+        if e.hasAttribute('grace'):
+            return 0
+        if ppq is None or not e.hasAttribute('dur'):
+            return None
+
+        dur = e.getAttribute('dur').value
+        if dur in MeitoMusicXML.dur_quarters:
+            quarters = MeitoMusicXML.dur_quarters[dur]
+        elif dur.isdigit() and int(dur) > 0:
+            quarters = Fraction(4, int(dur))
+        else:
+            return None
+
+        dots = int(e.getAttribute('dots').value) if e.hasAttribute('dots') else 0
+        duration = quarters * ppq * (2 - Fraction(1, 2 ** dots))
+        if duration.denominator != 1:
+            # not a whole number of divisions
+            return None
+
+        return int(duration)
+
+    def _memo_notes(self, sd, s):
+        '''
+        Returns copies of previously converted notes if a staff with the same
+        events was already converted in the same staff context, otherwise
+        converts the staff and caches the result
+        '''
+
+        context = tuple(sd.getAttribute(a).value if sd.hasAttribute(a) else None for a in ['ppq', 'tab.strings'])
+        fingerprint = self._fingerprints.get(s.getId())
+        if fingerprint is None:
+            # documents handed over in memory were not parsed by this converter
+            fingerprint = self._mei_fingerprint(s)
+        key = (context, fingerprint)
+        template = self.memo.get(key)
+        if template is None:
+            with self._recording_unhandled() as unhandled:
+                notes = self._notes_from_staff(s, self._get_ppq(sd))
+            # cache detached copies so later changes to the tree do not leak into the cache
+            self.memo.put(key, ([copy.deepcopy(n) for n in notes], unhandled))
+            return notes
+
+        notes, unhandled = template
+        self._count_unhandled(unhandled)
+        return [copy.deepcopy(n) for n in notes]
+
+    def _export(self, root):
+        '''
+        Writes the musicxml tree to the output path, or returns it as a byte
+        string if there is none. A list of movement trees is written as
+        numbered files plus an opus at the output path, or returned as a
+        list of byte strings.
+        '''
+
+        if isinstance(root, list):
+            if not hasattr(self, 'output_path'):
+                return self._map_movements(self._serialise, root)
+
+            paths = self._movement_paths(len(root))
+            self._map_movements(lambda i: self._write_file(paths[i], self._serialise(root[i])), range(len(root)))
+            self._write_opus(paths)
+            return
+
+        musicxml_str = self._serialise(root)
+        if hasattr(self, 'output_path'):
+            self._write_file(self.output_path, musicxml_str)
+        else:
+            return musicxml_str
+
+    def _serialise(self, root):
+        doctype = '<?xml version="1.0" encoding="UTF-8"?>\n' + MeitoMusicXML.doctypes[root.tag]
+        return etree.tostring(root, pretty_print=True, doctype=doctype)
+
+    def _write_file(self, path, musicxml_str):
+        fh = open(path, 'wb')
         fh.write(musicxml_str)
         fh.close()
+        with self._lock:
+            self.output_paths.append(path)
 
     def _create_rest(self, dur, dur_ges):
         note = etree.Element('note')
@@ -293,9 +702,36 @@ class MeitoMusicXML(FileConverter):
 
         return note
 
-    def _note_from_element(self, e):
+    def _create_time_shift(self, name, duration):
+        '''
+        Creates a musicxml backup or forward element
+        '''
+
+        shift = etree.Element(name)
+        xmlduration = etree.Element('duration')
+        xmlduration.text = str(duration)
+        shift.append(xmlduration)
+
+        return shift
+
+    def _set_voice(self, note, voice):
         '''
-        Create musicxml note from mei note element
+        Adds a voice to a musicxml note, before its type if there is one
+        '''
+
+        xmlvoice = etree.Element('voice')
+        xmlvoice.text = voice
+        type = note.find('type')
+        if type is not None:
+            type.addprevious(xmlvoice)
+        else:
+            note.append(xmlvoice)
+
+    def _note_from_element(self, e, ppq=None, member_chord=False):
+        '''
+        Create musicxml note from mei note element. Notes of a chord take
+        their duration from the chord; member_chord marks the notes after
+        the first, which sound with the previous note.
         '''
 
         pname = e.getAttribute('pname').value
@@ -320,15 +756,11 @@ class MeitoMusicXML(FileConverter):
         note_container = e.getParent()
         if note_container.getName() != 'chord':
             note_container = e
-            member_chord = False
-        else:
-            member_chord = True
 
-        if note_container.hasAttribute('dur.ges'):
-            dur_ges = note_container.getAttribute('dur.ges').value
-        else:
-            dur_ges = None
-        
+        dur_ges = self._get_dur_ges(note_container, ppq)
+        if dur_ges is not None:
+            dur_ges = str(dur_ges)
+
         if note_container.hasAttribute('dur'):
             dur = note_container.getAttribute('dur').value
         else:
@@ -387,24 +819,3 @@ class MeitoMusicXML(FileConverter):
             note.append(notations)
         
         return note
-
-if __name__ == '__main__':
-    # parse command line arguments
-    args = parser.parse_args()
-
-    input_path = args.filein
-    if not os.path.exists(input_path):
-        raise ValueError('The input file does not exist')
-
-    output_path = args.fileout
-
-    # check file extensions are correct for this type of conversion
-    _, input_ext = os.path.splitext(input_path)
-    if input_ext != '.mei':
-        raise ValueError('Input path must be a MEI file.')
-    _, output_ext = os.path.splitext(output_path)
-    if output_ext != '.xml':
-        raise ValueError('Ouput path must have the file extension .xml')
-
-    meiconv = MeitoMusicXML(input_path=input_path, output_path=output_path)
-    meiconv.convert()
@@ -22,6 +22,7 @@ THE SOFTWARE.
 
 from fileconverter import *
 import os
+import re
 
 class MusicXMLtoMei(FileConverter):
 
@@ -40,20 +41,54 @@ class MusicXMLtoMei(FileConverter):
     # integer of accidental is array index
     accidentals = [None, 's', 'ss', 'ff', 'f']
 
+    # note types given as digits, e.g. 32nd
+    dur_pattern = re.compile('^([0-9]+)(.*)$')
+
+    _timewise_transform = None
+
+    probe_patterns = {
+        'parts': b'<score-part ',
+        # the space leaves out measure-style, measure-layout etc.
+        'measures': b'<measure ',
+        # scores of an opus
+        'movements': b'<score '
+    }
+
+    # handlers of the elements of a part in a measure, called with the
+    # PartEvents they add mei elements to; see FileConverter.register_handler
+    handlers = {
+        'note': '_handle_note',
+        'backup': '_handle_backup',
+        'forward': '_handle_forward',
+        'attributes': '_handle_attributes'
+    }
+
     def __init__(self, **kwargs):
         super(MusicXMLtoMei, self).__init__(**kwargs)
 
     def convert(self):
-        if hasattr(self, 'input_path'):
-            self.mxml = etree.parse(self.input_path).getroot()
+        return self._export(self.build())
+
+    def build(self):
+        '''
+        Converts the input to an in-memory MeiDocument without serialising it.
+        Each movement (a single score, the scores of an opus or a list of
+        scores) becomes its own mei mdiv. Movements are converted one after
+        the other; with max_workers > 1 a thread pool overlaps their parsing
+        and timewise transforms, the rest holds the GIL (bench_movements.py).
+        '''
+
+        self._select_engine()
+        sources, opus = self._get_movements()
+        if len(sources) > 1 and self.max_workers > 1:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(sources))) as executor:
+                # map keeps the movements in order
+                movements = list(executor.map(self._convert_movement, sources))
         else:
-            self.mxml = etree.fromstring(self.input_str)
+            movements = [self._convert_movement(source) for source in sources]
 
-        # convert to timewise if partwise (easier to convert to mei)
-        if self.mxml.tag == 'score-partwise':
-            xslt_root = etree.parse(FileConverter.to_timewise_xslt_path)
-            transform = etree.XSLT(xslt_root)
-            self.mxml = transform(self.mxml).getroot()
+        self.mxml = movements[0][0]
 
         # begin constructing mei document
         self.meidoc = MeiDocument()
@@ -66,7 +101,10 @@ class MusicXMLtoMei(FileConverter):
         ###########################
         file_desc = MeiElement('fileDesc')
 
-        xml_movement_title = self._get_text(self.mxml.find('movement-title'))
+        if opus is not None:
+            xml_movement_title = self._get_text(opus.find('title'))
+        else:
+            xml_movement_title = self._get_text(self.mxml.find('movement-title'))
         title_stmt = self._create_title_stmt(xml_movement_title)
 
         identification = self.mxml.find('identification')
@@ -90,27 +128,168 @@ class MusicXMLtoMei(FileConverter):
         ###########################
         music = MeiElement('music')
         body = MeiElement('body')
+
+        # add the music data to the MEI document
+        mei.addChild(music)
+        music.addChild(body)
+        for n, (mxml, mdiv) in enumerate(movements):
+            if len(movements) > 1:
+                mdiv.addAttribute('n', str(n+1))
+                xml_movement_title = self._get_text(mxml.find('movement-title'))
+                if xml_movement_title is not None:
+                    mdiv.addAttribute('label', xml_movement_title)
+            body.addChild(mdiv)
+
+        return self.meidoc
+
+    def _probe_inputs(self):
+        '''
+        Probes the scores an opus refers to rather than the opus itself,
+        and counts parts and measures of in-memory trees directly
+        '''
+
+        if hasattr(self, 'input_doc'):
+            docs = self.input_doc
+            if not isinstance(docs, list):
+                docs = [docs]
+            return [(0, self._probe_tree(d)) for d in docs]
+
+        samples = self._probe_samples()
+        if len(samples) == 1 and b'<opus' in samples[0][1]:
+            base_dir = os.getcwd()
+            if hasattr(self, 'input_path'):
+                base_dir = os.path.dirname(os.path.abspath(self.input_path))
+            paths = self._get_opus_scores(self._parse_xml(), base_dir)
+            samples = [(os.path.getsize(p), self._read_sample(p)) for p in paths]
+
+        return [(size, self._probe_sample(sample, size)) for size, sample in samples]
+
+    def _probe_tree(self, mxml):
+        if hasattr(mxml, 'getroot'):
+            mxml = mxml.getroot()
+
+        if mxml.tag == 'score-partwise':
+            measures = len(mxml.xpath('part[1]/measure'))
+        else:
+            measures = len(mxml.xpath('measure'))
+
+        return {'parts': len(mxml.xpath('part-list/score-part')), 'measures': measures, 'movements': 1}
+
+    def _probe_sample(self, sample, file_size):
+        '''
+        Counts the measures of a partwise score in its first part only,
+        since every part repeats them
+        '''
+
+        counts = super(MusicXMLtoMei, self)._probe_sample(sample, file_size)
+        if b'<score-partwise' not in sample:
+            return counts
+
+        start = sample.find(b'<part ')
+        if start == -1:
+            counts['measures'] = 0
+            return counts
+
+        end = sample.find(b'</part>', start)
+        if end != -1:
+            counts['measures'] = sample.count(b'<measure ', start, end)
+        else:
+            # the first part runs past the sample, assume parts of similar size
+            part_size = float(file_size) / max(counts['parts'], 1)
+            counts['measures'] = int(sample.count(b'<measure ', start) * part_size / (len(sample) - start))
+
+        return counts
+
+    def _get_movements(self):
+        '''
+        Returns the movements of the input, as parsed musicxml
+        roots or paths still to be parsed, and the opus element
+        if the input is an opus
+        '''
+
+        if hasattr(self, 'input_paths'):
+            return list(self.input_paths), None
+
+        base_dir = os.getcwd()
+        if hasattr(self, 'input_doc'):
+            mxml = self.input_doc
+            if isinstance(mxml, list):
+                # movements handed over from MeitoMusicXML
+                return mxml, None
+            if hasattr(mxml, 'getroot'):
+                mxml = mxml.getroot()
+        else:
+            mxml = self._parse_xml()
+            if hasattr(self, 'input_path'):
+                base_dir = os.path.dirname(os.path.abspath(self.input_path))
+
+        if mxml.tag == 'opus':
+            # the probe may have listed the scores already
+            self.dependencies = []
+            return self._get_opus_scores(mxml, base_dir), mxml
+
+        return [mxml], None
+
+    def _get_opus_scores(self, opus, base_dir):
+        '''
+        Returns the paths of the scores of a musicxml opus in order,
+        following nested and linked opuses
+        '''
+
+        href = '{http://www.w3.org/1999/xlink}href'
+        scores = []
+        for e in opus:
+            if e.tag == 'score':
+                scores.append(os.path.join(base_dir, e.get(href)))
+                self.dependencies.append(scores[-1])
+            elif e.tag == 'opus':
+                scores.extend(self._get_opus_scores(e, base_dir))
+            elif e.tag == 'opus-link':
+                opus_path = os.path.join(base_dir, e.get(href))
+                self.dependencies.append(opus_path)
+                linked_opus = self._parse_xml(opus_path)
+                scores.extend(self._get_opus_scores(linked_opus, os.path.dirname(opus_path)))
+
+        return scores
+
+    def _convert_movement(self, source):
+        '''
+        Converts one musicxml score, given as a root element or a path,
+        to a mei mdiv. Returns the timewise musicxml root and the mdiv.
+        '''
+
+        if isinstance(source, str):
+            mxml = self._parse_xml(source)
+        else:
+            mxml = source
+
+        # convert to timewise if partwise (easier to convert to mei)
+        if mxml.tag == 'score-partwise':
+            mxml = MusicXMLtoMei._get_timewise_transform()(mxml).getroot()
+
         mdiv = MeiElement('mdiv')
         score = MeiElement('score')
 
         # scoreDef
-        xml_first_part = self.mxml.xpath("measure[@number='1']/part[1]")[0]
+        xml_first_part = mxml.xpath("measure[@number='1']/part[1]")[0]
         xml_key_fifths = self._get_text(xml_first_part.xpath("attributes/key/fifths"))
         xml_key_mode = self._get_text(xml_first_part.xpath("attributes/key/mode"))
         xml_meter = (self._get_text(xml_first_part.xpath("attributes/time/beats")),
                  self._get_text(xml_first_part.xpath("attributes/time/beat-type")))
-        score_def = self._create_score_def(xml_meter, xml_key_fifths, xml_key_mode)
+        first_score_def = self._create_score_def(xml_meter, xml_key_fifths, xml_key_mode)
 
         # staffGrp/staffDef
-        xml_parts = self.mxml.xpath('part-list/score-part')
+        xml_parts = mxml.xpath('part-list/score-part')
         staff_grp = MeiElement('staffGrp')
 
         # keep track of musicxml partid to staffdef in mei
         map_pid_sd = {}
+        # and the staff context measure content depends on, for memoisation
+        map_pid_ctx = {}
         for n, p in enumerate(xml_parts):
             xml_part_id = p.attrib.get('id')
             
-            xml_first_part_measure = self.mxml.xpath("measure[@number='1']/part[@id='"+xml_part_id+"']/attributes")[0]
+            xml_first_part_measure = mxml.xpath("measure[@number='1']/part[@id='"+xml_part_id+"']/attributes")[0]
             xml_label_full = self._get_text(p.xpath("part-name"))
             xml_label_abbr = self._get_text(p.xpath("part-abbreviation"))
 
@@ -141,6 +320,7 @@ class MusicXMLtoMei(FileConverter):
 
             staff_def = self._create_staff_def(str(n+1), xml_label_full, xml_label_abbr, xml_clef_shape, strings_pitches, xml_ppq, xml_key_fifths, xml_key_mode)
             map_pid_sd[xml_part_id] = staff_def
+            map_pid_ctx[xml_part_id] = (xml_ppq, xml_key_fifths, xml_key_mode, ' '.join(strings_pitches))
 
             # instruments
             xml_instr_name = self._get_text(p.xpath("score-instrument/instrument-name")).replace(' ', '_')
@@ -154,7 +334,7 @@ class MusicXMLtoMei(FileConverter):
         # parse music data
         prev_score_def = None
         section = MeiElement('section')
-        xml_measures = self.mxml.xpath("measure")
+        xml_measures = mxml.xpath("measure")
         for n, m in enumerate(xml_measures):
             measure = self._create_measure(str(n+1))
 
@@ -165,91 +345,207 @@ class MusicXMLtoMei(FileConverter):
             xml_key_mode = self._get_text(xml_parts[0].xpath("attributes/key/mode"))
             xml_meter = (self._get_text(xml_parts[0].xpath("attributes/time/beats")),
                          self._get_text(xml_parts[0].xpath("attributes/time/beat-type")))
-            score_def = self._create_score_def(xml_meter, xml_key_fifths, xml_key_mode)
-            if prev_score_def is None or not self._compare_elements(prev_score_def, score_def):
-                section.addChild(score_def)
-                prev_score_def = score_def
+            if xml_key_fifths is not None or xml_meter != (None, None):
+                score_def = self._create_score_def(xml_meter, xml_key_fifths, xml_key_mode)
+                if prev_score_def is None or not self._compare_elements(prev_score_def, score_def):
+                    section.addChild(score_def)
+                    prev_score_def = score_def
 
+            control_events = []
             for p in xml_parts:
                 xml_part_id = p.attrib.get('id')
                 staff_def = map_pid_sd[xml_part_id]
-                staff = self._create_staff(staff_def.getAttribute('n').getValue())
-                layer = self._create_layer()
-
-                # get notes played by the part
-                notes = p.xpath("note")
-                cur_chord = None
-                for i, n in enumerate(notes):
-                    dur_ges = self._get_text(n.xpath("duration"))
-                    type = self._get_text(n.xpath("type"))
-                    dur = MusicXMLtoMei.note_type.get(type)
-                    if dur is None:
-                        # check if there are digits in the type
-                        pattern = re.compile('^([0-9]+)(.*)$')
-                        match = pattern.match(type)
-                        if match:
-                            dur = match.group()
-
-                    if len(n.xpath("rest")):
-                        rest = self._create_rest(dur, dur_ges)
-                        layer.addChild(rest)
-                    else:
-                        pname = self._get_text(n.xpath("pitch/step"))
-                        oct = self._get_text(n.xpath("pitch/octave"))
-                        accid = None
-                        if n.xpath("boolean(pitch/alter)"):
-                            alter = self._get_text(n.xpath("pitch/alter"))
-                            accid = MusicXMLtoMei.accidentals[int(alter)]
-                        sx = n.xpath("notations/technical/string")
-                        string = None
-                        if len(sx):
-                            string = self._get_text(sx)
-                        fret = None
-                        fx = n.xpath("notations/technical/fret")
-                        if len(fx):
-                            fret = self._get_text(fx)
-                        
-                        next_chord_tag = False
-                        # look ahead to next note
-                        if i+1 < len(notes):
-                            next_chord_tag = notes[i+1].xpath("boolean(chord)")
-
-                        if next_chord_tag:
-                            # a chord is beginning or continuing
-                            if cur_chord is None:
-                                # a chord is beginning
-                                cur_chord = self._create_chord(dur, dur_ges)
-                                layer.addChild(cur_chord)
-
-                        if cur_chord is not None:
-                            note = self._create_note(pname, oct, string, fret, accid)
-                            cur_chord.addChild(note)
-                        else:
-                            note = self._create_note(pname, oct, string, fret, accid, dur=dur, dur_ges=dur_ges)
-                            layer.addChild(note)
-
-                        if not next_chord_tag:
-                            cur_chord = None
+                staff_n = staff_def.getAttribute('n').getValue()
+                staff = self._create_staff(staff_n)
+
+                # group the events played by the part into one layer per voice
+                if self.memo is not None:
+                    layers, part_control_events = self._memo_layers(map_pid_ctx[xml_part_id], p, staff_n)
+                else:
+                    layers, part_control_events = self._create_layers(p, staff_n)
 
                 measure.addChild(staff)
-                staff.addChild(layer)
+                for layer in layers:
+                    staff.addChild(layer)
+                control_events.extend(part_control_events)
+
+            # control events follow the staves of the measure
+            for e in control_events:
+                measure.addChild(e)
 
             section.addChild(measure)
 
-        # add the music data to the MEI document
-        mei.addChild(music)
-        music.addChild(body)
-        body.addChild(mdiv)
         mdiv.addChild(score)
-        score.addChild(score_def)
-        score_def.addChild(staff_grp)
+        score.addChild(first_score_def)
+        first_score_def.addChild(staff_grp)
         score.addChild(section)
 
+        return mxml, mdiv
+
+    @staticmethod
+    def _get_timewise_transform():
+        # compiled once, lxml lets XSLT objects be shared between threads
+        if MusicXMLtoMei._timewise_transform is None:
+            xslt_root = etree.parse(FileConverter.to_timewise_xslt_path)
+            MusicXMLtoMei._timewise_transform = etree.XSLT(xslt_root)
+        return MusicXMLtoMei._timewise_transform
+
+    def _group_events(self, part, staff_n=None):
+        '''
+        Dispatches the elements of a musicxml part in a measure to their
+        handlers in a single pass. Handlers build a PartEvents: the mei
+        elements of each voice with their time positions in divisions,
+        following backup and forward, and the control events of the part.
+        '''
+
+        events = PartEvents(staff_n)
+        for e in part:
+            # skip comments and processing instructions
+            if isinstance(e.tag, str):
+                self._handle(e.tag, e, events)
+
+        return events
+
+    def _handle_note(self, e, events):
+        if events.last_event is not None and e.find('chord') is not None:
+            # chord member, sounds with the previous note
+            self._add_chord_member(events.last_event, e)
+            return
+
+        voice = self._get_text(e.find('voice')) or '1'
+        duration = int(self._get_text(e.find('duration')) or 0)
+        events.add_event(voice, duration, self._create_event(e))
+
+    def _handle_backup(self, e, events):
+        events.pos -= int(self._get_text(e.find('duration')))
+        events.last_event = None
+
+    def _handle_forward(self, e, events):
+        events.pos += int(self._get_text(e.find('duration')))
+        events.last_event = None
+
+    def _handle_attributes(self, e, events):
+        # attributes are read when creating the scoreDef and staffDefs
+        pass
+
+    def _create_layers(self, part, staff_n=None):
+        '''
+        Creates one mei layer per voice of a musicxml part in a measure,
+        and returns them with the control events of the part.
+        Gaps in a voice, e.g. from forward, become mei spaces.
+        '''
+
+        events = self._group_events(part, staff_n)
+        layers = []
+        for voice, voice_events in events.voices.items():
+            layer = self._create_layer(str(len(layers)+1))
+            voice_pos = 0
+            for onset, duration, element in voice_events:
+                if onset > voice_pos:
+                    layer.addChild(self._create_space(str(onset - voice_pos)))
+                layer.addChild(element)
+                voice_pos = onset + duration
+            layers.append(layer)
+
+        if not layers:
+            layers.append(self._create_layer())
+
+        return layers, events.control_events
+
+    def _create_event(self, n):
+        '''
+        Creates a mei rest or note from a musicxml note
+        '''
+
+        dur_ges = self._get_text(n.xpath("duration"))
+        type = self._get_text(n.xpath("type"))
+        dur = MusicXMLtoMei.note_type.get(type)
+        if dur is None and type is not None:
+            # check if there are digits in the type
+            match = MusicXMLtoMei.dur_pattern.match(type)
+            if match:
+                dur = match.group()
+
+        if len(n.xpath("rest")):
+            return self._create_rest(dur, dur_ges)
+
+        return self._note_from_xml(n, dur=dur, dur_ges=dur_ges)
+
+    def _add_chord_member(self, event, n):
+        '''
+        Adds a musicxml chord member to the mei element of an event,
+        turning a single note into a chord with the note's duration
+        '''
+
+        element = event[2]
+        if element.getName() != 'chord':
+            dur = element.getAttribute('dur')
+            dur_ges = element.getAttribute('dur.ges')
+            chord = self._create_chord(dur and dur.getValue(), dur_ges and dur_ges.getValue())
+            element.removeAttribute('dur')
+            element.removeAttribute('dur.ges')
+            chord.addChild(element)
+            event[2] = element = chord
+
+        element.addChild(self._note_from_xml(n))
+
+    def _note_from_xml(self, n, **kwargs):
+        '''
+        Creates a mei note from a musicxml note
+        '''
+
+        pname = self._get_text(n.xpath("pitch/step"))
+        oct = self._get_text(n.xpath("pitch/octave"))
+        accid = None
+        if n.xpath("boolean(pitch/alter)"):
+            alter = self._get_text(n.xpath("pitch/alter"))
+            accid = MusicXMLtoMei.accidentals[int(alter)]
+        sx = n.xpath("notations/technical/string")
+        string = None
+        if len(sx):
+            string = self._get_text(sx)
+        fret = None
+        fx = n.xpath("notations/technical/fret")
+        if len(fx):
+            fret = self._get_text(fx)
+
+        return self._create_note(pname, oct, string, fret, accid, **kwargs)
+
+    def _memo_layers(self, context, part, staff_n=None):
+        '''
+        Returns copies of previously converted layers and control events if
+        the same events were already converted in the same staff context,
+        otherwise converts them and caches the result
+        '''
+
+        # elements without a handler only count towards unhandled, their names are enough
+        key = (context, staff_n) + tuple(etree.tostring(e, with_tail=False) if e.tag in self._dispatch else e.tag
+                                         for e in part if isinstance(e.tag, str))
+        template = self.memo.get(key)
+        if template is None:
+            with self._recording_unhandled() as unhandled:
+                layers, control_events = self._create_layers(part, staff_n)
+            # cache detached copies so later changes to the document do not leak into the cache
+            self.memo.put(key, ([self._clone_mei_element(l) for l in layers],
+                                [self._clone_mei_element(e) for e in control_events], unhandled))
+            return layers, control_events
+
+        layers, control_events, unhandled = template
+        self._count_unhandled(unhandled)
+        return [self._clone_mei_element(l) for l in layers], [self._clone_mei_element(e) for e in control_events]
+
+    def _export(self, meidoc):
+        '''
+        Writes the mei document to the output path,
+        or returns it as text if there is none
+        '''
+
         if hasattr(self, 'output_path'):
-            XmlExport.meiDocumentToFile(self.meidoc, self.output_path)
+            XmlExport.meiDocumentToFile(meidoc, self.output_path)
+            self.output_paths.append(self.output_path)
         else:
-            return XmlExport.meiDocumentToText(self.meidoc)
-        
+            return XmlExport.meiDocumentToText(meidoc)
+
     def _create_title_stmt(self, xml_title):
         '''
         Creates a mei titleStmt
@@ -303,10 +599,14 @@ class MusicXMLtoMei(FileConverter):
         '''
 
         score_def = MeiElement('scoreDef')
-        score_def.addAttribute('meter.count', meter[0])
-        score_def.addAttribute('meter.unit', meter[1])
-        score_def.addAttribute('key.sig', key_sig)
-        score_def.addAttribute('key.mode', key_mode)
+        if meter[0] is not None:
+            score_def.addAttribute('meter.count', meter[0])
+        if meter[1] is not None:
+            score_def.addAttribute('meter.unit', meter[1])
+        if key_sig is not None:
+            score_def.addAttribute('key.sig', key_sig)
+        if key_mode is not None:
+            score_def.addAttribute('key.mode', key_mode)
 
         return score_def
 
@@ -382,9 +682,9 @@ class MusicXMLtoMei(FileConverter):
             note.addAttribute('tab.string', string)
         if fret:
             note.addAttribute('tab.fret', fret)
-        if 'dur' in kwargs:
+        if kwargs.get('dur') is not None:
             note.addAttribute('dur', kwargs['dur'])
-        if 'dur_ges' in kwargs:
+        if kwargs.get('dur_ges') is not None:
             note.addAttribute('dur.ges', kwargs['dur_ges'])
 
         return note
@@ -395,39 +695,74 @@ class MusicXMLtoMei(FileConverter):
         '''
 
         rest = MeiElement('rest')
-        rest.addAttribute('dur', dur)
-        rest.addAttribute('dur.ges', dur_ges)
+        if dur is not None:
+            rest.addAttribute('dur', dur)
+        if dur_ges is not None:
+            rest.addAttribute('dur.ges', dur_ges)
 
         return rest
 
+    def _create_space(self, dur_ges):
+        '''
+        Creates a space element
+        '''
+
+        space = MeiElement('space')
+        space.addAttribute('dur.ges', dur_ges)
+
+        return space
+
     def _create_chord(self, dur, dur_ges):
         '''
         Creates a chord element
         '''
 
         chord = MeiElement('chord')
-        chord.addAttribute('dur', dur)
-        chord.addAttribute('dur.ges', dur_ges)
+        if dur is not None:
+            chord.addAttribute('dur', dur)
+        if dur_ges is not None:
+            chord.addAttribute('dur.ges', dur_ges)
 
         return chord
 
-if __name__ == '__main__':
-    # parse command line arguments
-    args = parser.parse_args()
+class PartEvents(object):
+    '''
+    What the handlers of MusicXMLtoMei build from a part in a measure: the
+    mei elements of each voice, sounding from an onset for a duration in
+    divisions, and control events (e.g. dynam, slur) added to the measure
+    after its staves
+    '''
+
+    def __init__(self, staff_n=None):
+        # @n of the staff the part is converted to
+        self.staff = staff_n
+        # voice to events, where an event is [onset, duration, mei element]
+        self.voices = OrderedDict()
+        # time position in divisions
+        self.pos = 0
+        # event the next chord member joins, None after backup or forward
+        self.last_event = None
+        self.control_events = []
+
+    def add_event(self, voice, duration, element):
+        '''
+        Adds a mei element to the layer of the voice, sounding from the
+        current position for duration divisions, and moves past it
+        '''
 
-    input_path = args.filein
-    if not os.path.exists(input_path):
-        raise ValueError('The input file does not exist')
+        event = [self.pos, duration, element]
+        self.voices.setdefault(voice, []).append(event)
+        self.last_event = event
+        self.pos += duration
 
-    output_path = args.fileout
+        return event
 
-    # check file extensions are correct for this type of conversion
-    _, input_ext = os.path.splitext(input_path)
-    if input_ext != '.xml':
-        raise ValueError('Input path must be an uncompressed MusicXML file')
-    _, output_ext = os.path.splitext(output_path)
-    if output_ext != '.mei':
-        raise ValueError('Ouput path must have the file extension .mei')
+    def add_control_event(self, element):
+        '''
+        Adds a mei control event to the measure, on the staff of the part
+        unless it names one
+        '''
 
-    meiconv = MusicXMLtoMei(input_path=input_path, output_path=output_path)
-    meiconv.convert()
+        if self.staff is not None and not element.hasAttribute('staff'):
+            element.addAttribute('staff', self.staff)
+        self.control_events.append(element)
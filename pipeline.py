@@ -0,0 +1,275 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+from fileconverter import *
+
+class Pipeline(object):
+    '''
+    Chains converters and document stages without serialising in between.
+
+    Stages are either FileConverter subclasses or callables that take the
+    current in-memory document (a MeiDocument or an lxml MusicXML tree),
+    modify it and optionally return a replacement document. The first
+    stage must be a converter; it receives the keyword arguments given
+    to run or build. For example, to normalise a MusicXML file:
+
+        Pipeline(MusicXMLtoMei, filter_parts(['1']), transpose(2), MeitoMusicXML)
+    '''
+
+    def __init__(self, *stages):
+        if not stages or not Pipeline._is_converter(stages[0]):
+            raise ValueError('A pipeline must start with a converter.')
+        self.stages = stages
+
+    def build(self, **kwargs):
+        '''
+        Runs every stage and returns the final in-memory document
+        '''
+
+        _, doc = self._run_stages(kwargs)
+        return doc
+
+    def run(self, **kwargs):
+        '''
+        Runs every stage and serialises the final document with the last
+        converter, to output_path if given or else returned as text
+        '''
+
+        output_path = kwargs.pop('output_path', None)
+        converter, doc = self._run_stages(kwargs)
+        if output_path is not None:
+            converter.output_path = output_path
+        return converter._export(doc)
+
+    def _run_stages(self, kwargs):
+        converter = None
+        doc = None
+        for stage in self.stages:
+            if Pipeline._is_converter(stage):
+                if converter is None:
+                    converter = stage(**kwargs)
+                else:
+                    converter = stage(input_doc=doc)
+                doc = converter.build()
+            else:
+                result = stage(doc)
+                if result is not None:
+                    doc = result
+
+        return converter, doc
+
+    @staticmethod
+    def _is_converter(stage):
+        return isinstance(stage, type) and issubclass(stage, FileConverter)
+
+def transpose(semitones):
+    '''
+    Pipeline stage transposing every note and key signature by a number of
+    semitones. Altered pitches are spelled with flats in flat keys and with
+    sharps otherwise, and tablature frets are moved along the same string
+    where possible.
+    '''
+
+    def stage(doc):
+        if isinstance(doc, MeiDocument):
+            _transpose_mei(doc, semitones)
+        else:
+            for mxml in _musicxml_movements(doc):
+                _transpose_musicxml(mxml, semitones)
+
+    return stage
+
+def filter_parts(keep):
+    '''
+    Pipeline stage keeping only the given parts: staff numbers (staffDef@n)
+    for MEI documents, part ids for MusicXML trees. Kept MEI staves are
+    renumbered in order within each movement.
+    '''
+
+    keep = set(str(k) for k in keep)
+
+    def stage(doc):
+        if isinstance(doc, MeiDocument):
+            _filter_parts_mei(doc, keep)
+        else:
+            for mxml in _musicxml_movements(doc):
+                _filter_parts_musicxml(mxml, keep)
+
+    return stage
+
+def _musicxml_movements(doc):
+    # MeitoMusicXML builds a list of trees for multi-movement documents
+    if isinstance(doc, list):
+        return doc
+    return [doc]
+
+# pitch classes spelled with flats, for transposing into flat keys
+flat_pitch_classes = ['C', 'Db', 'D', 'Eb', 'E', 'F', 'Gb', 'G', 'Ab', 'A', 'Bb', 'B']
+
+# mei accidentals to integer alterations
+mei_alter = {'s': 1, 'ss': 2, 'f': -1, 'ff': -2, 'n': 0}
+
+def _transpose_pitch(step, alter, octave, semitones, flats=False):
+    '''
+    Transposes a pitch given as step, integer alteration and octave,
+    spelling altered pitches with flats if flats is set, else sharps.
+    Returns the new (step, alter, octave).
+    '''
+
+    num_classes = len(FileConverter.pitch_classes)
+    pitch = FileConverter.pitch_classes.index(step.upper()) + alter + octave * num_classes + semitones
+    octave, pitch_ind = divmod(pitch, num_classes)
+    if flats:
+        pname = flat_pitch_classes[pitch_ind]
+        new_alter = -(len(pname) - 1)
+    else:
+        pname = FileConverter.pitch_classes[pitch_ind]
+        new_alter = len(pname) - 1
+
+    new_step = pname[0]
+    if step.islower():
+        new_step = new_step.lower()
+
+    return new_step, new_alter, octave
+
+def _transpose_fifths(fifths, semitones):
+    '''
+    Moves a key signature (number of fifths) by a number of semitones,
+    keeping it between 6 flats and 5 sharps
+    '''
+
+    return (int(fifths) + 7 * semitones + 6) % 12 - 6
+
+def _set_attribute(element, name, value):
+    if element.hasAttribute(name):
+        element.getAttribute(name).setValue(value)
+    else:
+        element.addAttribute(name, value)
+
+def _transpose_mei(meidoc, semitones):
+    # walk the document in order, spelling notes after the key in effect
+    fifths = 0
+    stack = [meidoc.getRootElement()]
+    while stack:
+        e = stack.pop()
+        stack.extend(reversed(e.getChildren()))
+
+        name = e.getName()
+        if name in ('scoreDef', 'staffDef'):
+            if e.hasAttribute('key.sig') and e.getAttribute('key.sig').value:
+                fifths = _transpose_fifths(e.getAttribute('key.sig').value, semitones)
+                _set_attribute(e, 'key.sig', str(fifths))
+        elif name == 'note':
+            _transpose_mei_note(e, semitones, fifths < 0)
+
+def _transpose_mei_note(note, semitones, flats):
+    accid = None
+    if note.hasAttribute('accid'):
+        accid = note.getAttribute('accid').value
+    elif note.hasAttribute('accid.ges'):
+        accid = note.getAttribute('accid.ges').value
+    alter = mei_alter.get(accid, 0)
+
+    pname, alter, oct = _transpose_pitch(note.getAttribute('pname').value, alter,
+                                         int(note.getAttribute('oct').value), semitones, flats)
+    _set_attribute(note, 'pname', pname)
+    _set_attribute(note, 'oct', str(oct))
+    note.removeAttribute('accid')
+    note.removeAttribute('accid.ges')
+    if alter > 0:
+        note.addAttribute('accid', 's')
+    elif alter < 0:
+        note.addAttribute('accid', 'f')
+
+    if note.hasAttribute('tab.fret'):
+        fret = int(note.getAttribute('tab.fret').value) + semitones
+        if fret >= 0:
+            _set_attribute(note, 'tab.fret', str(fret))
+        else:
+            note.removeAttribute('tab.fret')
+            note.removeAttribute('tab.string')
+
+def _transpose_musicxml(mxml, semitones):
+    # in document order, so each pitch is spelled after the key in effect
+    fifths = 0
+    for e in mxml.iter('fifths', 'pitch'):
+        if e.tag == 'fifths':
+            fifths = _transpose_fifths(e.text, semitones)
+            e.text = str(fifths)
+        else:
+            _transpose_musicxml_pitch(e, semitones, fifths < 0)
+
+def _transpose_musicxml_pitch(pitch, semitones, flats):
+    step = pitch.find('step')
+    alter = pitch.find('alter')
+    octave = pitch.find('octave')
+
+    alter_val = 0
+    if alter is not None:
+        alter_val = int(alter.text)
+
+    step.text, alter_val, oct = _transpose_pitch(step.text, alter_val, int(octave.text), semitones, flats)
+    octave.text = str(oct)
+    if alter_val:
+        if alter is None:
+            alter = etree.Element('alter')
+            octave.addprevious(alter)
+        alter.text = str(alter_val)
+    elif alter is not None:
+        pitch.remove(alter)
+
+    technical = pitch.getparent().find('notations/technical')
+    if technical is not None and technical.find('fret') is not None:
+        fret = int(technical.find('fret').text) + semitones
+        if fret >= 0:
+            technical.find('fret').text = str(fret)
+        else:
+            for e in technical.xpath('fret|string'):
+                technical.remove(e)
+
+def _filter_parts_mei(meidoc, keep):
+    movements = [m for m in meidoc.getElementsByName('mdiv') if m.getChildrenByName('score')]
+    if not movements:
+        movements = [meidoc.getRootElement()]
+
+    for movement in movements:
+        renumber = {}
+        for sd in movement.getDescendantsByName('staffDef'):
+            n = sd.getAttribute('n').value
+            if n in keep:
+                renumber[n] = str(len(renumber) + 1)
+                _set_attribute(sd, 'n', renumber[n])
+            else:
+                sd.getParent().removeChild(sd)
+
+        for staff in movement.getDescendantsByName('staff'):
+            n = staff.getAttribute('n').value
+            if n in renumber:
+                _set_attribute(staff, 'n', renumber[n])
+            else:
+                staff.getParent().removeChild(staff)
+
+def _filter_parts_musicxml(mxml, keep):
+    # score-part in the part-list, part in score-timewise measures or score-partwise root
+    for e in mxml.xpath('part-list/score-part|measure/part|part'):
+        if e.get('id') not in keep:
+            e.getparent().remove(e)
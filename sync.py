@@ -0,0 +1,309 @@
+'''
+Copyright (c) 2012 Gregory Burlet
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+'''
+
+# Incremental mirroring of a directory of MusicXML and/or MEI files.
+# A manifest in the destination records, for each source file, its size,
+# mtime and content hash, the files written, the records of other files
+# the conversion read (the scores of an opus) and the converter version,
+# so unchanged files are skipped from a stat alone. Entries are only written
+# after a successful conversion, so an interrupted sync resumes by
+# reconverting whatever was not recorded.
+
+import hashlib
+import json
+import os
+import sys
+
+from cli import convert_file, file_format
+
+manifest_name = '.musicxmlmei-sync.json'
+
+# output extension by input format
+output_exts = {
+    'musicxml': '.mei',
+    'mei': '.xml'
+}
+
+# files whose content determines the converter version
+converter_sources = ['fileconverter.py', 'musicxmltomei.py', 'meitomusicxml.py', 'partwisetotimewise.xslt']
+
+# completed conversions between manifest saves
+save_interval = 100
+
+def converter_version():
+    '''
+    Returns a hash of the converter sources, so outputs are
+    regenerated when the conversion code changes
+    '''
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    sha1 = hashlib.sha1()
+    for name in converter_sources:
+        with open(os.path.join(here, name), 'rb') as fh:
+            sha1.update(fh.read())
+
+    return sha1.hexdigest()
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b''):
+            sha1.update(chunk)
+
+    return sha1.hexdigest()
+
+def output_path_for(rel_path):
+    '''
+    Returns the output path, relative to the destination, of a source
+    file relative to the source directory, or None if it is not a score
+    '''
+
+    input_format, compression = file_format(rel_path)
+    if input_format is None:
+        return None
+
+    base = rel_path
+    if compression == 'gzip':
+        base = base[:-3]
+
+    return os.path.splitext(base)[0] + output_exts[input_format]
+
+def scan(src):
+    '''
+    Yields (relative path, stat result) of every score below src
+    '''
+
+    stack = [src]
+    while stack:
+        directory = stack.pop()
+        for entry in os.scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                stack.append(entry.path)
+            elif entry.is_file() and file_format(entry.name)[0] is not None:
+                yield os.path.relpath(entry.path, src), entry.stat()
+
+def load_manifest(dst):
+    try:
+        with open(os.path.join(dst, manifest_name)) as fh:
+            return json.load(fh)['files']
+    except (IOError, OSError, ValueError, KeyError):
+        return {}
+
+def save_manifest(dst, files):
+    # write then rename so an interruption never leaves a truncated manifest
+    path = os.path.join(dst, manifest_name)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as fh:
+        json.dump({'files': files}, fh)
+    os.replace(tmp_path, path)
+
+def file_record(path, st=None):
+    '''
+    Returns the size, mtime and content hash of a file
+    '''
+
+    if st is None:
+        st = os.stat(path)
+
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha1': file_hash(path)}
+
+def unchanged(path, record, st=None):
+    '''
+    Returns whether the file at path still has the recorded content, from
+    a stat alone unless it was touched; a touched file is hashed and its
+    record takes the new mtime if the content is the same
+    '''
+
+    if st is None:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+
+    if record['size'] != st.st_size:
+        return False
+    if record['mtime_ns'] != st.st_mtime_ns:
+        if record['sha1'] != file_hash(path):
+            return False
+        record['mtime_ns'] = st.st_mtime_ns
+
+    return True
+
+def _convert(src_path, out_path):
+    '''
+    Worker: converts one file. Returns the record of the source as it was
+    converted, the paths of every file written (the movements and opus
+    of multi-movement output) and the records of the other files the
+    conversion read, e.g. the scores of an opus.
+    '''
+
+    record = file_record(src_path)
+
+    out_dir = os.path.dirname(out_path)
+    if out_dir and not os.path.isdir(out_dir):
+        os.makedirs(out_dir, exist_ok=True)
+    converter = convert_file(src_path, out_path)
+
+    dependencies = dict((path, file_record(path)) for path in converter.dependencies)
+
+    return record, converter.output_paths, dependencies
+
+def _outputs(entry):
+    # manifests written before outputs were listed only have the main output
+    return entry.get('outputs') or [entry['output']]
+
+def _remove_outputs(dst, rel_outputs, sources):
+    # an output path that a live source maps to is left for that source
+    for rel_output in rel_outputs:
+        if rel_output not in sources:
+            _remove_output(dst, rel_output)
+
+def _remove_output(dst, rel_output):
+    path = os.path.join(dst, rel_output)
+    if os.path.exists(path):
+        os.remove(path)
+
+    # prune directories left empty, without leaving the destination
+    directory = os.path.dirname(path)
+    while os.path.abspath(directory) != os.path.abspath(dst):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+        directory = os.path.dirname(directory)
+
+def sync(src, dst, max_workers=None, log=None):
+    '''
+    Mirrors the scores below src to dst: converts new and changed files
+    in parallel, skips unchanged ones and deletes outputs whose source
+    is gone. Sources that would write the same output are skipped and
+    counted as conflicts. Returns a dictionary of counts.
+    '''
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if not os.path.isdir(dst):
+        os.makedirs(dst)
+
+    version = converter_version()
+    files = load_manifest(dst)
+    stats = {'unchanged': 0, 'converted': 0, 'deleted': 0, 'failed': 0, 'conflicts': 0}
+
+    # sources by output path; e.g. x.xml and x.musicxml would both write x.mei
+    sources = {}
+    for rel_path, st in scan(src):
+        sources.setdefault(output_path_for(rel_path), []).append((rel_path, st))
+
+    todo = []
+    seen = set()
+    for rel_output, output_sources in sorted(sources.items()):
+        seen.update(rel_path for rel_path, _ in output_sources)
+        if len(output_sources) > 1:
+            # which source wins would depend on scheduling, so convert none of them
+            stats['conflicts'] += len(output_sources)
+            if log is not None:
+                log('conflict: %s all convert to %s, skipped' % (', '.join(sorted(p for p, _ in output_sources)), rel_output))
+            continue
+
+        rel_path, st = output_sources[0]
+        entry = files.get(rel_path)
+
+        if entry is not None and (entry['converter'] != version or entry['output'] != rel_output
+                                  or not all(os.path.exists(os.path.join(dst, p)) for p in _outputs(entry))):
+            entry = None
+        elif entry is not None and not unchanged(os.path.join(src, rel_path), entry, st):
+            entry = None
+        elif entry is not None:
+            # e.g. the scores of an opus
+            for dep_path, record in entry.get('dependencies', {}).items():
+                if not unchanged(os.path.join(src, dep_path), record):
+                    entry = None
+                    break
+
+        if entry is None:
+            todo.append((rel_path, rel_output, files.pop(rel_path, None)))
+        else:
+            stats['unchanged'] += 1
+
+    # outputs of deleted sources, unless another source now writes them
+    for rel_path in [p for p in files if p not in seen]:
+        _remove_outputs(dst, _outputs(files.pop(rel_path)), sources)
+        stats['deleted'] += 1
+
+    if todo:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for rel_path, rel_output, old in todo:
+                future = executor.submit(_convert, os.path.join(src, rel_path), os.path.join(dst, rel_output))
+                futures[future] = (rel_path, rel_output, old)
+
+            for done, future in enumerate(as_completed(futures)):
+                rel_path, rel_output, old = futures[future]
+                try:
+                    record, output_paths, dependencies = future.result()
+                except Exception as e:
+                    stats['failed'] += 1
+                    if log is not None:
+                        log('failed: %s: %s' % (rel_path, e))
+                    if old is not None:
+                        # keep track of the previous outputs; the stale record gets the source reconverted next time
+                        files[rel_path] = old
+                else:
+                    outputs = [os.path.relpath(p, dst) for p in output_paths]
+                    if old is not None:
+                        _remove_outputs(dst, [p for p in _outputs(old) if p not in outputs], sources)
+
+                    record.update({
+                        'output': rel_output,
+                        'outputs': outputs,
+                        'dependencies': dict((os.path.relpath(p, src), r) for p, r in dependencies.items()),
+                        'converter': version
+                    })
+                    files[rel_path] = record
+                    stats['converted'] += 1
+
+                if (done + 1) % save_interval == 0:
+                    save_manifest(dst, files)
+
+    save_manifest(dst, files)
+
+    return stats
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog='cli.py sync', description='Mirror a directory of MusicXML and MEI files, converting only new or changed files.')
+    parser.add_argument('src', help='source directory')
+    parser.add_argument('dst', help='destination directory')
+    parser.add_argument('-j', '--jobs', help='number of worker processes', type=int, default=None)
+    parser.add_argument('-v', '--verbose', help='increase output verbosity', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.src):
+        parser.error('The source directory does not exist')
+
+    log = lambda message: sys.stderr.write(message + '\n')
+    stats = sync(args.src, args.dst, max_workers=args.jobs, log=log)
+    if args.verbose:
+        log('%(converted)d converted, %(unchanged)d unchanged, %(deleted)d deleted, %(failed)d failed, %(conflicts)d conflicts' % stats)
+    if stats['failed'] or stats['conflicts']:
+        sys.exit(1)
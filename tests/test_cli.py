@@ -0,0 +1,69 @@
+import os
+import zipfile
+
+import pytest
+
+import cli
+
+score_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'voices.xml')
+
+def test_file_format():
+    assert cli.file_format('score.xml') == ('musicxml', None)
+    assert cli.file_format('score.musicxml') == ('musicxml', None)
+    assert cli.file_format('score.mxl') == ('musicxml', 'mxl')
+    assert cli.file_format('Score.XML.GZ') == ('musicxml', 'gzip')
+    assert cli.file_format('score.mei.gz') == ('mei', 'gzip')
+    assert cli.file_format('score.txt') == (None, None)
+
+def test_get_converter_rejects_direction():
+    for input_path, output_path in [('a.xml', 'b.xml'), ('a.mei', 'b.mei.gz'), ('a.txt', 'b.mei')]:
+        with pytest.raises(ValueError):
+            cli.get_converter(input_path, output_path)
+
+def test_get_converter():
+    pytest.importorskip('pymei')
+
+    assert cli.get_converter('a.mxl', 'b.mei.gz').__name__ == 'MusicXMLtoMei'
+    assert cli.get_converter('a.mei', 'b.musicxml').__name__ == 'MeitoMusicXML'
+
+@pytest.mark.parametrize('name, compression', [('score.xml.gz', 'gzip'), ('score.mxl', 'mxl')])
+def test_compressed_round_trip(tmp_path, name, compression):
+    with open(score_path, 'rb') as fh:
+        data = fh.read()
+
+    path = str(tmp_path / name)
+    cli._write_compressed(path, compression, data)
+    assert cli._read_compressed(path, compression) == data
+
+def test_mxl_container_names_score(tmp_path):
+    path = str(tmp_path / 'score.mxl')
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr('META-INF/container.xml', '<container><rootfiles><rootfile full-path="music/score.xml"/></rootfiles></container>')
+        archive.writestr('music/other.xml', b'<other/>')
+        archive.writestr('music/score.xml', b'<score-partwise/>')
+
+    assert cli._read_compressed(path, 'mxl') == b'<score-partwise/>'
+
+@pytest.mark.parametrize('args', [['--stream'], ['--engine', 'stream', '--partwise']])
+def test_stream_rejects_compressed_output(tmp_path, capsys, args):
+    input_path = tmp_path / 'score.mei'
+    input_path.write_text('<mei/>')
+
+    for output_name in ['score.mxl', 'score.xml.gz']:
+        with pytest.raises(SystemExit) as e:
+            cli.main([str(input_path), str(tmp_path / output_name)] + args)
+        assert e.value.code == 2
+        assert 'cannot compress' in capsys.readouterr().err
+
+def test_convert_compressed_round_trip(tmp_path):
+    pytest.importorskip('pymei')
+
+    mei_path = str(tmp_path / 'score.mei.gz')
+    mxl_path = str(tmp_path / 'score.mxl')
+    assert cli.convert_file(score_path, mei_path).output_paths == [mei_path]
+    assert cli.convert_file(mei_path, mxl_path, output_format='partwise').output_paths == [mxl_path]
+
+    from lxml import etree
+    score = etree.fromstring(cli._read_compressed(mxl_path, 'mxl'))
+    assert score.tag == 'score-partwise'
+    assert len(score.findall('part/measure/note')) == 7
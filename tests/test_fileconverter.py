@@ -0,0 +1,131 @@
+import asyncio
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+pytest.importorskip('pymei')
+
+from fileconverter import FileConverter, MeasureCache
+from meitomusicxml import MeitoMusicXML
+from musicxmltomei import MusicXMLtoMei
+
+score_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'voices.xml')
+
+def _large_score(min_size=11 << 20):
+    # larger than the ~10 MB libxml2 accepts in a single feed
+    measure = b'<measure number="1"><part id="p0"><note><rest/><duration>4</duration></note></part></measure>'
+    count = min_size // len(measure) + 1
+    return b'<score-timewise>' + measure * count + b'</score-timewise>', count
+
+def test_large_bytes_input():
+    data, count = _large_score()
+    root = FileConverter(input_buffer=data)._parse_xml()
+    assert len(root) == count
+
+def test_large_str_input():
+    data, count = _large_score()
+    root = FileConverter(input_str=data.decode('utf-8'))._parse_xml()
+    assert len(root) == count
+
+def test_large_bytearray_input():
+    data, count = _large_score()
+    root = FileConverter(input_buffer=bytearray(data))._parse_xml()
+    assert len(root) == count
+
+def test_large_mei_input():
+    layer = b'<measure n="1"><staff n="1"><layer n="1"><rest dur="4"/></layer></staff></measure>'
+    count = (11 << 20) // len(layer) + 1
+    data = b'<mei><music><body><mdiv><score><section>' + layer * count + b'</section></score></mdiv></body></music></mei>'
+    meidoc = FileConverter(input_buffer=data)._parse_mei()
+    assert len(meidoc.getElementsByName('measure')) == count
+
+def test_mei_tail_text():
+    data = '<mei><meiHead><fileDesc><titleStmt><title>Sym <rend>No.</rend> 5 <rend>in</rend> C</title></titleStmt></fileDesc></meiHead></mei>'
+    converter = FileConverter(input_str=data)
+    # feed a character at a time, so tails are read after the end of their element
+    converter.feed_size = 1
+    title = converter._parse_mei().getElementsByName('title')[0]
+    assert title.getValue() == 'Sym '
+    assert [r.getTail() for r in title.getChildren()] == [' 5 ', ' C']
+
+def test_measure_cache_pickles():
+
+    cache = MeasureCache(2)
+    cache.put('a', 1)
+    cache.get('a')
+    copy = pickle.loads(pickle.dumps(cache))
+    assert copy.get('a') == 1
+    assert copy.stats()['hits'] == 2
+
+def test_convert_async_in_process_pool():
+    converter = MusicXMLtoMei(input_path=score_path, memo_size=16)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        result = asyncio.run(converter.convert_async(executor=executor))
+    assert b'<mei' in result
+
+class _Stream(object):
+    def __init__(self, data, reads):
+        self.data = data
+        self.reads = reads
+
+    async def read(self):
+        self.reads.append(self)
+        return self.data
+
+class _Writer(object):
+    def __init__(self):
+        self.data = b''
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+def _multi_movement_mei():
+    return MusicXMLtoMei(input_paths=[score_path, score_path]).convert()
+
+def test_convert_async_reads_stream_in_slot(monkeypatch):
+    with open(score_path, 'rb') as fh:
+        data = fh.read()
+
+    monkeypatch.setattr(FileConverter, 'max_concurrent', 1)
+    FileConverter._executor = None
+
+    async def run():
+        reads = []
+        converters = [MusicXMLtoMei(input_stream=_Stream(data, reads)) for _ in range(3)]
+        tasks = [asyncio.ensure_future(c.convert_async()) for c in converters]
+        await asyncio.sleep(0)
+        # only the conversion holding the slot has read its input
+        assert len(reads) == 1
+        return await asyncio.gather(*tasks)
+
+    try:
+        results = asyncio.run(run())
+    finally:
+        if FileConverter._executor is not None:
+            FileConverter._executor.shutdown()
+        FileConverter._executor = None
+    assert all(b'<mei' in r for r in results)
+
+def test_convert_async_multi_movement():
+    mei = _multi_movement_mei()
+    result = asyncio.run(MeitoMusicXML(input_str=mei).convert_async())
+    assert len(result) == 2
+    assert all(isinstance(r, bytes) for r in result)
+
+    with pytest.raises(ValueError):
+        asyncio.run(MeitoMusicXML(input_str=mei).convert_async(writer=_Writer()))
+
+def test_probe_str_size():
+    data = '<score-timewise>' + '<!-- é -->' * 100000 + '</score-timewise>'
+    converter = FileConverter(input_str=data)
+    converter.probe_size = 4096
+    probe = converter._probe()
+    assert abs(probe['input_size'] - len(data.encode('utf-8'))) < len(data) // 100
+
+    data = '<score-timewise/>'
+    assert FileConverter(input_str=data)._probe()['input_size'] == len(data)
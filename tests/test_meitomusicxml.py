@@ -0,0 +1,125 @@
+import pytest
+
+pytest.importorskip('pymei')
+
+from meitomusicxml import MeitoMusicXML
+
+def _mei(layers, ppq='2'):
+    staff_def = ('<staffDef n="1" label.full="Piano" clef.shape="G" clef.line="2" key.sig="0" key.mode="major"%s>'
+                 '<instrDef n="Piano" midi.channel="1" midi.instrnum="1"/></staffDef>')
+    return ('<mei><meiHead><fileDesc><titleStmt><title>Layers</title></titleStmt></fileDesc></meiHead>'
+            '<music><body><mdiv><score><scoreDef meter.count="4" meter.unit="4"><staffGrp>'
+            + staff_def % (' ppq="%s"' % ppq if ppq else '')
+            + '</staffGrp></scoreDef><section><measure n="1"><staff n="1">'
+            + ''.join('<layer n="%d">%s</layer>' % (n+1, l) for n, l in enumerate(layers))
+            + '</staff></measure></section></score></mdiv></body></music></mei>')
+
+def _part(mxml):
+    return mxml.find('measure/part')
+
+def test_durations_from_dur():
+    # no dur.ges: durations come from dur, dots and ppq, tuplets included
+    layers = [
+        '<note pname="c" oct="5" dur="2" dots="1"/><note pname="d" oct="5" dur="4"/>',
+        '<tuplet num="3" numbase="2"><note pname="e" oct="4" dur="4"/><note pname="f" oct="4" dur="4"/>'
+        '<note pname="g" oct="4" dur="4"/></tuplet><rest dur="2"/>'
+    ]
+    mxml = MeitoMusicXML(input_str=_mei(layers, ppq='6')).build()
+
+    part = _part(mxml)
+    assert [n.findtext('duration') for n in part.iter('note')] == ['18', '6', '4', '4', '4', '12']
+    assert part.findtext('backup/duration') == '24'
+    assert [n.findtext('voice') for n in part.iter('note')] == ['1', '1', '2', '2', '2', '2']
+
+def test_unknown_durations_raise():
+    layers = ['<note pname="c" oct="5" dur="1"/>', '<note pname="e" oct="4" dur="1"/>']
+    with pytest.raises(ValueError):
+        MeitoMusicXML(input_str=_mei(layers, ppq=None)).build()
+
+    # a single layer needs no alignment
+    mxml = MeitoMusicXML(input_str=_mei(layers[:1], ppq=None)).build()
+    assert len(list(_part(mxml).iter('note'))) == 1
+
+def test_chord_marks_following_notes():
+    layers = [
+        '<note pname="e" oct="5" dur="2"/><chord dur="2"><note pname="c" oct="5"/><note pname="e" oct="5"/></chord>',
+        '<chord dur="1"><note pname="g" oct="4"/><note pname="b" oct="4"/></chord>'
+    ]
+    mxml = MeitoMusicXML(input_str=_mei(layers)).build()
+
+    notes = list(_part(mxml).iter('note'))
+    assert [n.find('chord') is not None for n in notes] == [False, False, True, False, True]
+    assert [n.findtext('duration') for n in notes] == ['4', '4', '4', '8', '8']
+
+def test_auto_engine_memory_estimate(tmp_path):
+    data = _mei(['<note pname="c" oct="5" dur="1"/>'])
+    size = len(data)
+    output_path = str(tmp_path / 'out.xml')
+
+    # input and output trees exceed the budget, the input tree alone fits
+    converter = MeitoMusicXML(input_str=data, output_path=output_path, output_format='partwise',
+                              engine='auto', memory_budget=size * 15)
+    converter.convert()
+    assert converter.stats['engine'] == 'stream'
+    assert converter.stats['estimated_memory'] == converter.stats['input_memory']
+
+    converter = MeitoMusicXML(input_str=data, output_path=output_path, output_format='partwise',
+                              engine='auto', memory_budget=size * 25)
+    converter.convert()
+    assert converter.stats['engine'] == 'memory'
+    assert converter.stats['estimated_memory'] == converter.stats['input_memory'] + converter.stats['output_memory']
+
+def test_stream_engine_requires_partwise(tmp_path):
+    data = _mei(['<note pname="c" oct="5" dur="1"/>'])
+    converter = MeitoMusicXML(input_str=data, output_path=str(tmp_path / 'out.xml'), engine='stream')
+    with pytest.raises(ValueError):
+        converter.convert()
+    assert converter.output_format == 'timewise'
+
+def test_stream_matches_partwise(tmp_path):
+    layers = ['<note pname="c" oct="5" dur="2"/><chord dur="2"><note pname="e" oct="5"/><note pname="g" oct="5"/></chord>']
+    data = _mei(layers)
+    streamed_path = str(tmp_path / 'streamed.xml')
+    MeitoMusicXML(input_str=data, output_path=streamed_path, output_format='partwise', stream=True).convert()
+    built_path = str(tmp_path / 'built.xml')
+    MeitoMusicXML(input_str=data, output_path=built_path, output_format='partwise').convert()
+
+    from lxml import etree
+    parser = etree.XMLParser(remove_blank_text=True)
+    streamed = etree.parse(streamed_path, parser).getroot()
+    built = etree.parse(built_path, parser).getroot()
+    assert etree.tostring(streamed.find('part')) == etree.tostring(built.find('part'))
+
+def test_rejects_input_paths():
+    with pytest.raises(ValueError):
+        MeitoMusicXML(input_paths=['a.mei', 'b.mei'])
+
+def test_movements_sequential_by_default():
+    assert MeitoMusicXML(input_str=_mei(['<note pname="c" oct="5" dur="1"/>'])).max_workers == 1
+
+def _repeated_mei(num_measures):
+    # the same staff in every measure, with a clef change nothing handles
+    mei = _mei(['<clef shape="G" line="2"/><note pname="c" oct="5" dur="2" dur.ges="4"/><rest dur="2" dur.ges="4"/>'])
+    measure = mei[mei.index('<measure'):mei.index('</section>')]
+    measures = ''.join(measure.replace('n="1">', 'n="%d">' % (n+1), 1) for n in range(num_measures))
+    return mei.replace(measure, measures)
+
+def test_memo_on_repeated_measures():
+    from lxml import etree
+
+    mei = _repeated_mei(8)
+    plain = MeitoMusicXML(input_str=mei)
+    expected = etree.tostring(plain.build())
+
+    memo = MeitoMusicXML(input_str=mei, memo_size=4)
+    assert etree.tostring(memo.build()) == expected
+    assert (memo.memo.misses, memo.memo.hits) == (1, 7)
+    # parsed staves are fingerprinted from their source
+    assert len(memo._fingerprints) == 8
+    # skipped elements are counted for cached staves too
+    assert memo.unhandled == plain.unhandled == {'clef': 8}
+
+    # documents handed over in memory are fingerprinted from the mei tree
+    in_memory = MeitoMusicXML(input_doc=MeitoMusicXML(input_str=mei)._parse_mei(), memo_size=4)
+    assert etree.tostring(in_memory.build()) == expected
+    assert (in_memory.memo.misses, in_memory.memo.hits) == (1, 7)
@@ -0,0 +1,182 @@
+import os
+
+import pytest
+
+pytest.importorskip('pymei')
+
+from pymei import MeiElement
+from musicxmltomei import MusicXMLtoMei
+
+score_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'voices.xml')
+
+def _partwise(parts, measures):
+    part_list = ''.join('<score-part id="P%d"><part-name>%d</part-name></score-part>' % (p, p) for p in range(parts))
+    measure = ('<measure number="%d"><attributes><measure-style><slash type="start"/></measure-style></attributes>'
+               '<note><rest/><duration>4</duration></note></measure>')
+    body = ''.join('<part id="P%d">%s</part>' % (p, ''.join(measure % (m+1) for m in range(measures))) for p in range(parts))
+    return '<score-partwise><part-list>%s</part-list>%s</score-partwise>' % (part_list, body)
+
+def test_probe_counts_measures_of_first_part():
+    probe = MusicXMLtoMei(input_str=_partwise(8, 20))._probe()
+    assert probe['parts'] == 8
+    assert probe['measures'] == 20
+
+def test_probe_extrapolates_cut_off_part():
+    converter = MusicXMLtoMei(input_str=_partwise(4, 400))
+    converter.probe_size = 4096
+    probe = converter._probe()
+    assert 300 <= probe['measures'] <= 500
+
+def _layers(meidoc):
+    layers = []
+    for layer in meidoc.getElementsByName('layer'):
+        events = []
+        for e in layer.getChildren():
+            if e.getName() == 'chord':
+                events.append(('chord', e.getAttribute('dur.ges').value, [n.getAttribute('pname').value for n in e.getChildren()]))
+            elif e.getName() == 'note':
+                events.append(('note', e.getAttribute('dur.ges').value, [e.getAttribute('pname').value]))
+            else:
+                events.append((e.getName(), e.getAttribute('dur.ges').value, []))
+        layers.append(events)
+    return layers
+
+def test_group_events_by_voice():
+    from lxml import etree
+
+    mxml = etree.parse(score_path).getroot()
+    part = mxml.find('part/measure')
+    voices = MusicXMLtoMei(input_path=score_path)._group_events(part).voices
+
+    assert list(voices) == ['1', '2']
+    # [onset, duration, mei element]: backup returns to 0, forward moves on to 1
+    assert [(onset, duration, e.getName()) for onset, duration, e in voices['1']] == [(0, 2, 'note'), (2, 1, 'chord'), (3, 1, 'rest')]
+    assert [(onset, duration, e.getName()) for onset, duration, e in voices['2']] == [(1, 1, 'chord'), (2, 2, 'note')]
+
+def test_layers_per_voice():
+    meidoc = MusicXMLtoMei(input_path=score_path).build()
+
+    assert _layers(meidoc) == [
+        [('note', '2', ['E']), ('chord', '1', ['C', 'E']), ('rest', '1', [])],
+        [('space', '1', []), ('chord', '1', ['G', 'B']), ('note', '2', ['A'])]
+    ]
+    layer_2 = meidoc.getElementsByName('layer')[1]
+    assert layer_2.getAttribute('n').value == '2'
+
+def _with_directions():
+    from lxml import etree
+
+    mxml = etree.parse(score_path).getroot()
+    measure = mxml.find('part/measure')
+    direction = etree.fromstring('<direction><direction-type><dynamics><p/></dynamics></direction-type></direction>')
+    measure.insert(measure.index(measure.find('note')), direction)
+    measure.append(etree.fromstring('<harmony><root><root-step>C</root-step></root></harmony>'))
+    return mxml
+
+def test_unhandled_counts():
+    converter = MusicXMLtoMei(input_doc=_with_directions())
+    meidoc = converter.build()
+    assert converter.unhandled == {'direction': 1, 'harmony': 1}
+    assert meidoc.getElementsByName('dynam') == []
+
+def _handle_dynamics(converter, e, events):
+    dynam = MeiElement('dynam')
+    dynam.setValue(e.find('direction-type/dynamics')[0].tag)
+    # tstamp counts beats from 1, the fixture has a division per beat
+    dynam.addAttribute('tstamp', str(events.pos + 1))
+    events.add_control_event(dynam)
+
+def _handle_forward_space(converter, e, events):
+    # an explicit space instead of a gap
+    duration = int(e.find('duration').text)
+    space = MeiElement('space')
+    space.addAttribute('dur.ges', str(duration))
+    events.add_event(e.findtext('voice') or '2', duration, space)
+
+def test_registered_handlers_emit_mei():
+    class Directions(MusicXMLtoMei):
+        pass
+
+    Directions.register_handler('direction', _handle_dynamics)
+    Directions.register_handler('forward', _handle_forward_space)
+
+    converter = Directions(input_doc=_with_directions())
+    meidoc = converter.build()
+    assert converter.unhandled == {'harmony': 1}
+
+    measure = meidoc.getElementsByName('measure')[0]
+    assert [e.getName() for e in measure.getChildren()] == ['staff', 'dynam']
+    dynam = measure.getChildren()[1]
+    assert (dynam.getValue(), dynam.getAttribute('staff').value, dynam.getAttribute('tstamp').value) == ('p', '1', '1')
+    assert _layers(meidoc) == _layers(MusicXMLtoMei(input_path=score_path).build())
+
+    # the parent class keeps its own handlers
+    assert 'direction' not in MusicXMLtoMei.handlers
+    assert MusicXMLtoMei.handlers['forward'] == '_handle_forward'
+    assert MusicXMLtoMei(input_doc=_with_directions()).build().getElementsByName('dynam') == []
+
+def test_memoised_layers_match():
+    meidoc = MusicXMLtoMei(input_path=score_path, memo_size=4).build()
+    assert _layers(meidoc) == _layers(MusicXMLtoMei(input_path=score_path).build())
+
+def test_memo_replays_unhandled():
+    from lxml import etree
+
+    mxml = _with_directions()
+    part = mxml.find('part')
+    second = etree.fromstring(etree.tostring(part.find('measure')))
+    second.set('number', '2')
+    part.append(second)
+
+    plain = MusicXMLtoMei(input_doc=mxml)
+    plain.build()
+    memo = MusicXMLtoMei(input_doc=mxml, memo_size=4)
+    memo.build()
+    assert memo.memo.hits == 1
+    assert memo.unhandled == plain.unhandled == {'direction': 2, 'harmony': 2}
+
+def test_score_def_only_for_changes():
+    from lxml import etree
+
+    mxml = etree.parse(score_path).getroot()
+    part = mxml.find('part')
+    second = etree.fromstring(etree.tostring(part.find('measure')))
+    second.set('number', '2')
+    second.remove(second.find('attributes'))
+    part.append(second)
+
+    meidoc = MusicXMLtoMei(input_doc=mxml).build()
+    assert len(meidoc.getElementsByName('measure')) == 2
+    section = meidoc.getElementsByName('section')[0]
+    assert [e.getName() for e in section.getChildren()] == ['scoreDef', 'measure', 'measure']
+
+def _write_opus(tmp_path, num_scores):
+    for n in range(num_scores):
+        (tmp_path / ('score-%d.xml' % n)).write_text(_partwise(8, 200))
+    scores = ''.join('<score xlink:href="score-%d.xml"/>' % n for n in range(num_scores))
+    opus_path = tmp_path / 'opus.xml'
+    opus_path.write_text('<opus xmlns:xlink="http://www.w3.org/1999/xlink"><title>Opus</title>%s</opus>' % scores)
+    return str(opus_path)
+
+def test_probe_follows_opus(tmp_path):
+    probe = MusicXMLtoMei(input_path=_write_opus(tmp_path, 2))._probe()
+    assert probe['movements'] == 2
+    assert probe['parts'] == 8
+    assert probe['measures'] == 400
+    assert probe['input_size'] > 0
+
+def test_probe_counts_trees():
+    from lxml import etree
+
+    trees = [etree.fromstring(_partwise(3, 10)), etree.fromstring(_partwise(5, 20))]
+    probe = MusicXMLtoMei(input_doc=trees)._probe()
+    assert (probe['movements'], probe['parts'], probe['measures']) == (2, 5, 30)
+
+def test_auto_engine_parallel_for_opus(tmp_path, monkeypatch):
+    import os
+    monkeypatch.setattr(os, 'cpu_count', lambda: 4)
+
+    converter = MusicXMLtoMei(input_path=_write_opus(tmp_path, 2), engine='auto')
+    converter._select_engine()
+    assert converter.stats['engine'] == 'parallel'
+    assert converter.max_workers == 4
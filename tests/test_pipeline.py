@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+pytest.importorskip('pymei')
+
+from meitomusicxml import MeitoMusicXML
+from musicxmltomei import MusicXMLtoMei
+from pipeline import Pipeline
+
+score_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'voices.xml')
+
+def _mei_input():
+    return MusicXMLtoMei(input_path=score_path).convert()
+
+def test_mei_to_musicxml_to_mei():
+    # MeitoMusicXML writes no part-abbreviation
+    meidoc = Pipeline(MeitoMusicXML, MusicXMLtoMei).build(input_str=_mei_input())
+
+    staff_defs = meidoc.getElementsByName('staffDef')
+    assert [sd.getAttribute('label.full').value for sd in staff_defs] == ['Piano']
+    assert len(meidoc.getElementsByName('measure')) == 1
+    assert len(meidoc.getElementsByName('layer')) == 2
+
+    # chords survive the round trip without merging into the preceding note
+    layers = meidoc.getElementsByName('layer')
+    assert [e.getName() for e in layers[0].getChildren()] == ['note', 'chord', 'rest']
+    assert [e.getName() for e in layers[1].getChildren()] == ['space', 'chord', 'note']
+    assert [len(c.getChildren()) for c in meidoc.getElementsByName('chord')] == [2, 2]
+
+def test_transpose_spells_with_key():
+    from pipeline import transpose
+
+    # C major up a semitone is Db major, so E5 becomes F5, C5 becomes Db5 and B-flat4 becomes B4
+    meidoc = Pipeline(MusicXMLtoMei, transpose(1)).build(input_path=score_path)
+
+    assert meidoc.getElementsByName('scoreDef')[0].getAttribute('key.sig').value == '-5'
+    chord = meidoc.getElementsByName('chord')[0]
+    spelled = [(n.getAttribute('pname').value, n.getAttribute('accid').value if n.hasAttribute('accid') else None)
+               for n in chord.getChildrenByName('note')]
+    assert spelled == [('D', 'f'), ('F', None)]
+
+    # up a whole tone is D major, spelled with sharps
+    mxml = Pipeline(MusicXMLtoMei, MeitoMusicXML, transpose(2)).build(input_path=score_path)
+    assert mxml.find('measure/part/attributes/key/fifths').text == '2'
+    pitches = [(p.findtext('step'), p.findtext('alter')) for p in mxml.iter('pitch')]
+    assert ('F', '1') in pitches
+    assert ('C', None) in pitches
@@ -0,0 +1,140 @@
+import json
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('pymei')
+
+import sync
+
+score_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'voices.xml')
+
+@pytest.fixture
+def dirs(tmp_path):
+    src = tmp_path / 'src'
+    dst = tmp_path / 'dst'
+    (src / 'b').mkdir(parents=True)
+    shutil.copy(score_path, str(src / 'one.xml'))
+    shutil.copy(score_path, str(src / 'b' / 'two.xml'))
+    return str(src), str(dst)
+
+def _run(src, dst):
+    messages = []
+    stats = sync.sync(src, dst, max_workers=1, log=messages.append)
+    return stats, messages
+
+def _manifest(dst):
+    with open(os.path.join(dst, sync.manifest_name)) as fh:
+        return json.load(fh)['files']
+
+def test_skips_unchanged(dirs):
+    src, dst = dirs
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 2
+    assert os.path.exists(os.path.join(dst, 'one.mei'))
+    assert os.path.exists(os.path.join(dst, 'b', 'two.mei'))
+
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 0
+    assert stats['unchanged'] == 2
+
+def test_touch_rehashes(dirs):
+    src, dst = dirs
+    _run(src, dst)
+    output = os.path.join(dst, 'one.mei')
+    output_mtime = os.stat(output).st_mtime_ns
+
+    st = os.stat(os.path.join(src, 'one.xml'))
+    os.utime(os.path.join(src, 'one.xml'), ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 0
+    assert stats['unchanged'] == 2
+    assert os.stat(output).st_mtime_ns == output_mtime
+    assert _manifest(dst)['one.xml']['mtime_ns'] == st.st_mtime_ns + 10**9
+
+    # same size, different content
+    with open(os.path.join(src, 'one.xml'), 'r+') as fh:
+        data = fh.read().replace('Anonymous', 'Anonymoux')
+        fh.seek(0)
+        fh.write(data)
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 1
+
+def test_deletes_orphaned_outputs(dirs):
+    src, dst = dirs
+    _run(src, dst)
+    os.remove(os.path.join(src, 'b', 'two.xml'))
+    stats, _ = _run(src, dst)
+    assert stats['deleted'] == 1
+    assert not os.path.exists(os.path.join(dst, 'b'))
+    assert list(_manifest(dst)) == ['one.xml']
+
+def test_resumes_after_failure(dirs):
+    src, dst = dirs
+    with open(os.path.join(src, 'broken.xml'), 'w') as fh:
+        fh.write('<score-partwise>')
+    stats, messages = _run(src, dst)
+    assert stats['converted'] == 2
+    assert stats['failed'] == 1
+    assert 'broken.xml' not in _manifest(dst)
+
+    shutil.copy(score_path, os.path.join(src, 'broken.xml'))
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 1
+    assert stats['unchanged'] == 2
+
+def test_conflicting_outputs(dirs):
+    src, dst = dirs
+    _run(src, dst)
+    shutil.copy(score_path, os.path.join(src, 'b', 'two.musicxml'))
+    stats, messages = _run(src, dst)
+    assert stats['conflicts'] == 2
+    assert stats['converted'] == 0
+    assert any('two.mei' in m for m in messages)
+
+    # the remaining source takes over the output instead of it being deleted
+    os.remove(os.path.join(src, 'b', 'two.xml'))
+    stats, _ = _run(src, dst)
+    assert stats['deleted'] == 1
+    assert stats['converted'] == 1
+    assert os.path.exists(os.path.join(dst, 'b', 'two.mei'))
+    assert _manifest(dst)[os.path.join('b', 'two.musicxml')]['output'] == os.path.join('b', 'two.mei')
+
+def test_multi_movement_outputs(dirs):
+    from musicxmltomei import MusicXMLtoMei
+
+    src, dst = dirs
+    with open(os.path.join(src, 'op.mei'), 'w') as fh:
+        fh.write(MusicXMLtoMei(input_paths=[score_path, score_path]).convert())
+    _run(src, dst)
+    for name in ['op.xml', 'op-1.xml', 'op-2.xml']:
+        assert os.path.exists(os.path.join(dst, name))
+    assert sorted(_manifest(dst)['op.mei']['outputs']) == ['op-1.xml', 'op-2.xml', 'op.xml']
+
+    os.remove(os.path.join(src, 'op.mei'))
+    stats, _ = _run(src, dst)
+    assert stats['deleted'] == 1
+    for name in ['op.xml', 'op-1.xml', 'op-2.xml']:
+        assert not os.path.exists(os.path.join(dst, name))
+
+def test_opus_follows_scores(dirs):
+    src, dst = dirs
+    with open(os.path.join(src, 'opus.xml'), 'w') as fh:
+        fh.write('<opus xmlns:xlink="http://www.w3.org/1999/xlink"><title>Opus</title>'
+                 '<score xlink:href="one.xml"/><score xlink:href="b/two.xml"/></opus>')
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 3
+    assert sorted(_manifest(dst)['opus.xml']['dependencies']) == sorted(['one.xml', os.path.join('b', 'two.xml')])
+
+    stats, _ = _run(src, dst)
+    assert stats['unchanged'] == 3
+
+    # editing a score reconverts the score and the opus
+    with open(os.path.join(src, 'b', 'two.xml'), 'r+') as fh:
+        data = fh.read().replace('Voices', 'Voicez')
+        fh.seek(0)
+        fh.write(data)
+    stats, _ = _run(src, dst)
+    assert stats['converted'] == 2
+    assert stats['unchanged'] == 1